@@ -0,0 +1,79 @@
+import argparse
+import glob
+import os
+import timeit
+
+from bs4 import BeautifulSoup
+
+import implementations.html_content_extractor as html_content_extractor
+from implementations.html_content_extractor import HTMLContentExtractor
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def legacy_parse(html: str) -> tuple[str, str]:
+    # The extractor as it was before the single-pass rewrite, kept as the baseline.
+    soup = BeautifulSoup(html, 'html.parser')
+
+    title_tag = soup.find('h1')
+    if not title_tag:
+        title_tag = soup.find('title')
+    title = title_tag.get_text(strip=True) if title_tag else "No title"
+
+    article = soup.find('article')
+    if article:
+        paragraphs = article.find_all('p')
+    else:
+        divs = soup.find_all('div')
+        max_p_count = 0
+        best_div = None
+        for div in divs:
+            p_count = len(div.find_all('p'))
+            if p_count > max_p_count:
+                max_p_count = p_count
+                best_div = div
+        paragraphs = best_div.find_all('p') if best_div else []
+
+    return title, "\n".join(p.get_text(strip=True) for p in paragraphs)
+
+
+def available_parsers() -> list:
+    parsers = ['html.parser']
+    try:
+        import lxml  # noqa: F401
+        parsers.append('lxml')
+    except ImportError:
+        pass
+    return parsers
+
+
+def bench(parse, html: str, repeat: int) -> float:
+    return min(timeit.repeat(lambda: parse(html), number=1, repeat=repeat)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTMLContentExtractor.parse on saved HTML fixtures.")
+    parser.add_argument('--fixtures', type=str, default=FIXTURES_DIR, help="Directory with *.html fixtures")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement; the best one is reported")
+    args = parser.parse_args()
+
+    print(f"{'fixture':<24}{'backend':<20}{'best ms':>10}{'text chars':>12}")
+    for path in sorted(glob.glob(os.path.join(args.fixtures, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        name = os.path.basename(path)
+
+        baseline = legacy_parse(html)
+        print(f"{name:<24}{'legacy html.parser':<20}{bench(legacy_parse, html, args.repeat):>10.2f}"
+              f"{len(baseline[1]):>12}")
+
+        for backend in available_parsers():
+            html_content_extractor.HTML_PARSER = backend
+            result = HTMLContentExtractor.parse(html)
+            marker = "" if backend != 'html.parser' or result == baseline else "  (differs from legacy)"
+            print(f"{name:<24}{backend:<20}{bench(HTMLContentExtractor.parse, html, args.repeat):>10.2f}"
+                  f"{len(result[1]):>12}{marker}")
+
+
+if __name__ == "__main__":
+    main()
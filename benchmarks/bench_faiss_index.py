@@ -0,0 +1,114 @@
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from implementations.stores.faiss_store import (COMPRESSIONS, INDEX_TYPES, create_faiss_index, exact_rerank,
+                                                set_search_parameters)
+
+
+def clustered_vectors(count: int, dimension: int, clusters: int, rng: np.random.Generator,
+                      basis: np.ndarray = None) -> np.ndarray:
+    # Text embeddings are far from uniform; a Gaussian mixture is a closer stand-in.
+    # With a basis the mixture lives in fewer dimensions and is projected up,
+    # like embeddings whose variance is concentrated in a few directions.
+    latent = dimension if basis is None else basis.shape[0]
+    centers = rng.normal(size=(clusters, latent)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    vectors = centers[labels] + 0.3 * rng.normal(size=(count, latent)).astype(np.float32)
+    if basis is not None:
+        vectors = vectors @ basis + 0.02 * rng.normal(size=(count, dimension)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def measure(index: faiss.Index, queries: np.ndarray, k: int, truth: np.ndarray, rerank: int = 0,
+            vectors: np.ndarray = None) -> tuple:
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, positions = index.search(query[None, :], k * rerank if rerank else k)
+        row = positions[0]
+        if rerank:
+            row = row[row != -1]
+            row = row[exact_rerank(query, vectors[row], k)[0]]
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(row)
+    recall = np.mean([len(set(row) & set(expected)) / k for row, expected in zip(found, truth)])
+    return recall, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall versus latency of FAISS index types against exact search.")
+    parser.add_argument('--count', type=int, default=50000, help="Number of indexed vectors")
+    parser.add_argument('--dimension', type=int, default=256,
+                        help="Vector size (text-embedding-3-large produces 3072)")
+    parser.add_argument('--queries', type=int, default=300, help="Number of queries")
+    parser.add_argument('--k', type=int, default=10, help="Neighbours per query")
+    parser.add_argument('--nlist', type=int, default=1024, help="Inverted lists for IVF indexes")
+    parser.add_argument('--pq_m', type=int, default=32, help="Sub-vectors for IVFPQ")
+    parser.add_argument('--hnsw_m', type=int, default=32, help="Neighbours per node for HNSW")
+    parser.add_argument('--intrinsic_dimension', type=int, default=0,
+                        help="Generate the vectors in this many dimensions and project them up "
+                             "(0 to fill every dimension)")
+    parser.add_argument('--compression_index', choices=INDEX_TYPES, default="Flat",
+                        help="Index type the vector compression settings are compared on")
+    parser.add_argument('--pca_dimensions', type=int, nargs='*', default=[0, 64],
+                        help="PCA output sizes to compare (0 keeps every dimension)")
+    parser.add_argument('--rerank', type=int, default=4,
+                        help="Candidates per result re-ranked from full-precision vectors")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    basis = None
+    if args.intrinsic_dimension:
+        basis = rng.normal(size=(args.intrinsic_dimension, args.dimension)).astype(np.float32)
+    vectors = clustered_vectors(args.count, args.dimension, 200, rng, basis)
+    queries = clustered_vectors(args.queries, args.dimension, 200, rng, basis)
+
+    flat = create_faiss_index("Flat", vectors)
+    flat.add(vectors)
+    _, truth = flat.search(queries, args.k)
+
+    sweeps = {
+        "Flat": [("-", {})],
+        "HNSW": [(f"efSearch={ef}", {"ef_search": ef}) for ef in (16, 32, 64, 128, 256)],
+        "IVFFlat": [(f"nprobe={nprobe}", {"nprobe": nprobe}) for nprobe in (1, 4, 16, 64)],
+        "IVFPQ": [(f"nprobe={nprobe}", {"nprobe": nprobe}) for nprobe in (1, 4, 16, 64)],
+    }
+
+    print(f"{args.count} vectors x {args.dimension} dims, {args.queries} queries, recall@{args.k} vs Flat")
+    print(f"{'index':<10}{'params':<16}{'build s':>9}{'MB':>9}{'recall':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for index_type, settings in sweeps.items():
+        start = time.perf_counter()
+        index = create_faiss_index(index_type, vectors, nlist=args.nlist, pq_m=args.pq_m, hnsw_m=args.hnsw_m)
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 1024 / 1024
+
+        for label, params in settings:
+            set_search_parameters(index, **params)
+            recall, p50, p99 = measure(index, queries, args.k, truth)
+            print(f"{index_type:<10}{label:<16}{build_seconds:>9.2f}{size_mb:>9.1f}{recall:>9.3f}{p50:>9.3f}{p99:>9.3f}")
+
+    print(f"\nVector compression on {args.compression_index}, re-ranking {args.rerank}x k candidates "
+          f"from full-precision vectors")
+    print(f"{'pca':<6}{'codes':<8}{'rerank':<8}{'MB':>9}{'ratio':>8}{'recall':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    full_mb = None
+    for pca_dimensions in args.pca_dimensions:
+        for compression in COMPRESSIONS:
+            index = create_faiss_index(args.compression_index, vectors, nlist=args.nlist, pq_m=args.pq_m,
+                                       hnsw_m=args.hnsw_m, compression=compression, pca_dimensions=pca_dimensions)
+            index.add(vectors)
+            size_mb = faiss.serialize_index(index).nbytes / 1024 / 1024
+            full_mb = full_mb or size_mb
+            for rerank in (0, args.rerank):
+                recall, p50, p99 = measure(index, queries, args.k, truth, rerank, vectors)
+                print(f"{pca_dimensions or '-':<6}{compression:<8}{rerank or '-':<8}{size_mb:>9.1f}"
+                      f"{full_mb / size_mb:>7.1f}x{recall:>9.3f}{p50:>9.3f}{p99:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
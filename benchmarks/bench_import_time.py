@@ -0,0 +1,57 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What each kind of invocation imports before it can do any work.
+MODES = {
+    "help": "import main",
+    "client": "import client",
+    "analyzer": "import main; main.get_analyzer_class()",
+    "query-FAISS": "import main; main.get_analyzer_class(); main.get_store_class('FAISS')",
+    "query-Chroma": "import main; main.get_analyzer_class(); main.get_store_class('Chroma')",
+    "build": "import main; import implementations.ingestion_pipeline, implementations.analysis_scheduler, "
+             "implementations.html_content_extractor, implementations.basic_document_creator",
+}
+
+
+def import_times(snippet: str) -> tuple:
+    # -X importtime writes "import time: self [us] | cumulative | imported package"
+    # to stderr for every module, nested imports indented under their parent.
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", snippet], cwd=ROOT,
+                            capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"})
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    total = 0
+    top_level = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        total += int(self_us)
+        if not name[1:].startswith(" "):
+            top_level.append((int(cumulative_us), name.strip()))
+    return total, sorted(top_level, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import cost of each CLI mode.")
+    parser.add_argument('--modes', nargs='*', default=list(MODES), choices=list(MODES), help="Modes to measure")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per mode; the median is reported")
+    parser.add_argument('--top', type=int, default=5, help="Number of heaviest top-level imports to list")
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        runs = [import_times(MODES[mode]) for _ in range(args.repeat)]
+        median_ms = statistics.median(total for total, _ in runs) / 1000
+        print(f"{mode:<14}{median_ms:>10.1f} ms")
+        for cumulative_us, name in runs[-1][1][:args.top]:
+            print(f"    {name:<40}{cumulative_us / 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.stub_servers import ArticleSiteHandler, OpenAIStubHandler, article_topics, start_server
+from implementations.duplicate_index import DuplicateIndex
+from implementations.fetch_cache import FetchCache
+from implementations.registry import STORES, get_analyzer_class, get_embeddings_class
+from main import add_pipeline_arguments, add_store_arguments, create_pipeline, create_store, store_options
+from utils.metrics import METRICS
+
+STAGES = ("fetch", "parse", "analyze")
+
+
+def stub_embeddings(base_url: str, dimensions: int):
+    from langchain_openai import OpenAIEmbeddings
+
+    # Skips tiktoken length checks, which would download the tokenizer on first use.
+    return OpenAIEmbeddings(model="openai/text-embedding-3-large", openai_api_key="stub",
+                            openai_api_base=base_url, dimensions=dimensions,
+                            check_embedding_ctx_length=False)
+
+
+def measure_searches(store, queries: list, k: int) -> tuple:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        store.search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="End-to-end ingest, build and search timings against local stand-ins for news sites and the LLM API.")
+    parser.add_argument('--sizes', type=int, nargs='*', default=[100, 500, 2000], help="Corpus sizes to run")
+    parser.add_argument('--stores', nargs='*', default=list(STORES), choices=list(STORES), help="Stores to build")
+    parser.add_argument('--queries', type=int, default=200, help="Searches per store and corpus size")
+    parser.add_argument('--k', type=int, default=5, help="Results per search")
+    parser.add_argument('--paragraphs', type=int, default=12, help="Paragraphs per synthetic article")
+    parser.add_argument('--dimensions', type=int, default=256,
+                        help="Embedding size (text-embedding-3-large produces 3072)")
+    parser.add_argument('--embeddings', choices=['stub', 'hashed'], default='stub',
+                        help="Embed through the LLM stub over HTTP, or locally with hashed embeddings")
+    parser.add_argument('--duplicate_ratio', type=float, default=0.0,
+                        help="Share of pages that republish an earlier article")
+    parser.add_argument('--page_latency', type=float, default=0.05, help="Seconds the article site takes per page")
+    parser.add_argument('--chat_latency', type=float, default=0.5,
+                        help="Seconds the LLM stub takes per chat completion")
+    parser.add_argument('--embedding_latency', type=float, default=0.05,
+                        help="Seconds the LLM stub takes per embeddings request")
+    add_store_arguments(parser)
+    add_pipeline_arguments(parser)
+    parser.add_argument('--logging', action='store_true', help="Log pipeline and store progress to stderr")
+    args = parser.parse_args()
+    args.cache_only = False
+    logging.basicConfig(level=logging.INFO if args.logging else logging.CRITICAL)
+
+    os.environ.setdefault("GENAI_API_KEY", "stub")
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    site, site_url = start_server(ArticleSiteHandler, latency=args.page_latency, paragraphs=args.paragraphs,
+                                   duplicate_ratio=args.duplicate_ratio)
+    llm, llm_url = start_server(OpenAIStubHandler, chat_latency=args.chat_latency,
+                                embedding_latency=args.embedding_latency, dimensions=args.dimensions)
+    if args.embeddings == 'hashed':
+        embeddings = get_embeddings_class('hashed')(dimensions=args.dimensions)
+    else:
+        embeddings = stub_embeddings(f"{llm_url}/v1", args.dimensions)
+    rng = random.Random(0)
+
+    print(f"page {args.page_latency * 1000:.0f} ms, chat {args.chat_latency * 1000:.0f} ms, "
+          f"{args.embeddings} embeddings {args.embedding_latency * 1000:.0f} ms, {args.dimensions} dims, "
+          f"{args.fetch_workers} fetch / {args.parse_workers} parse / {args.analyze_workers} analyze workers")
+    print(f"{'docs':>6}{'dups':>6}{'ingest s':>10}{'docs/s':>9}" + "".join(f"{stage + ' ms':>12}" for stage in STAGES)
+          + f"  {'store':<8}{'build s':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    try:
+        for size in args.sizes:
+            # Caches start empty so every size pays for every fetch, analysis and embedding.
+            run_dir = os.path.join(workdir, str(size))
+            os.makedirs(run_dir)
+            analyzer = get_analyzer_class()(httpReferer=f"{llm_url}/v1", embedding_cache="", analysis_cache="")
+            fetch_cache = FetchCache(os.path.join(run_dir, "fetch_cache.db"))
+            duplicates = (DuplicateIndex(os.path.join(run_dir, "duplicates.db"), threshold=args.dedup_threshold)
+                          if args.dedup_index else None)
+            pipeline = create_pipeline(args, analyzer, fetch_cache, duplicates)
+
+            METRICS.reset()
+            start = time.perf_counter()
+            documents = pipeline.run(f"{site_url}/news/{number}" for number in range(size))
+            ingest_seconds = time.perf_counter() - start
+            fetch_cache.close()
+            if duplicates is not None:
+                duplicates.close()
+            # Busy time is summed over every worker of a stage, so it can exceed wall time.
+            stages = METRICS.summary()["stages"]
+
+            numbers = [rng.randrange(size) for _ in range(args.queries)]
+            queries = [" ".join(article_topics(number)) + " news" for number in numbers]
+            row = (f"{len(documents):>6}{len(pipeline.aliases):>6}{ingest_seconds:>10.2f}{len(documents) / ingest_seconds:>9.1f}"
+                   + "".join(f"{stages.get(stage, {}).get('total_seconds', 0) * 1000 / max(1, len(documents)):>12.1f}"
+                             for stage in STAGES))
+            for name in args.stores:
+                options = store_options(argparse.Namespace(**vars(args), index=name))
+                store = create_store(name, embeddings, index_path=os.path.join(run_dir, name), **options)
+                start = time.perf_counter()
+                store.build_index(documents)
+                build_seconds = time.perf_counter() - start
+                p50, p99 = measure_searches(store, queries, args.k)
+                print(f"{row}  {name:<8}{build_seconds:>9.2f}{p50:>9.2f}{p99:>9.2f}")
+                row = " " * len(row)
+    finally:
+        site.shutdown()
+        llm.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
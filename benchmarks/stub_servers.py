@@ -0,0 +1,224 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+TOPICS = ["politics", "economy", "climate", "technology", "health", "sport", "science", "culture",
+          "education", "transport", "energy", "housing", "crime", "travel", "food", "space"]
+TOPIC_WORDS = {
+    topic: [f"{topic}{suffix}" for suffix in ("", "s", "-policy", "-report", "-crisis", "-plan", "-market")]
+    for topic in TOPICS
+}
+COMMON_WORDS = ("the a of to and in that for on with as was at by from said would has have its after "
+                "more than year people government new first last over two three week officials").split()
+
+ARTICLE_PATH = re.compile(r"^/news/(\d+)$")
+BATCH_ARTICLE = re.compile(r"Article (\d+)\nTitle: (.*)")
+TITLE_LINE = re.compile(r"Title: (.*)")
+
+
+def article_topics(number: int) -> list:
+    rng = random.Random(number)
+    return rng.sample(TOPICS, 2)
+
+
+def article_title(number: int) -> str:
+    first, second = article_topics(number)
+    return f"Article {number}: {first} and {second} update"
+
+
+def syndicated_source(number: int, duplicate_ratio: float) -> int:
+    # Some pages republish an earlier article, the way syndicated news does.
+    while number:
+        rng = random.Random(f"syndication-{number}")
+        if rng.random() >= duplicate_ratio:
+            break
+        number = rng.randrange(number)
+    return number
+
+
+def article_html(number: int, paragraphs: int = 12, duplicate_ratio: float = 0.0) -> str:
+    page = number
+    number = syndicated_source(page, duplicate_ratio)
+    rng = random.Random(number)
+    words = [word for topic in article_topics(number) for word in TOPIC_WORDS[topic]]
+    body = "\n".join(
+        "<p>" + " ".join(rng.choice(words) if rng.random() < 0.3 else rng.choice(COMMON_WORDS)
+                         for _ in range(60)) + ".</p>"
+        for _ in range(paragraphs)
+    )
+    if page != number and page % 2:
+        # Half of the copies carry an extra credit line, so they are near rather than exact duplicates.
+        body += f"\n<p>This story was first published by partner site {page % 7} and is republished here.</p>"
+    nav = "".join(f'<li><a href="/section/{topic}">{topic}</a></li>' for topic in TOPICS)
+    # Every other page has no <article> tag, like sites that only use nested
+    # divs, so both extraction paths are exercised.
+    if number % 2:
+        content = f'<div class="story"><div class="story-body">{body}</div></div>'
+    else:
+        content = f"<article>{body}</article>"
+    return (f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{article_title(number)}</title></head>"
+            f"<body><header><nav><ul>{nav}</ul></nav></header><main><h1>{article_title(number)}</h1>"
+            f"{content}</main><footer><p>Copyright</p></footer></body></html>")
+
+
+def topics_in(text: str) -> list:
+    return [topic for topic in TOPICS if re.search(rf"\b{topic}\b", text)]
+
+
+def hashed_vector(item, dimensions: int) -> list:
+    # A bag of hashed words (or token ids), so texts sharing words get similar
+    # vectors and searches return meaningful neighbours.
+    tokens = item if isinstance(item, list) else item.lower().split()
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for token in tokens:
+        digest = hashlib.md5(str(token).encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "little") % dimensions] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive like a real API; without TCP_NODELAY the header and body
+    # writes hit the 40 ms delayed-ACK stall on every response.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: dict):
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ArticleSiteHandler(StubHandler):
+    latency = 0.0
+    paragraphs = 12
+    duplicate_ratio = 0.0
+
+    def do_GET(self):
+        match = ARTICLE_PATH.match(self.path)
+        if not match:
+            self._send(404, b"Not found", "text/plain")
+            return
+        time.sleep(self.latency)
+        number = int(match.group(1))
+        etag = f'"{number}-{self.paragraphs}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = article_html(number, self.paragraphs, self.duplicate_ratio).encode("utf-8")
+        self._send(200, body, "text/html; charset=utf-8", {"ETag": etag})
+
+
+class OpenAIStubHandler(StubHandler):
+    chat_latency = 0.0
+    token_latency = 0.0
+    embedding_latency = 0.0
+    dimensions = 256
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.endswith("/chat/completions"):
+            time.sleep(self.chat_latency)
+            if request.get("stream"):
+                self._stream_chat(self._chat(request))
+            else:
+                self._send_json(200, self._chat(request))
+        elif self.path.endswith("/embeddings"):
+            time.sleep(self.embedding_latency)
+            self._send_json(200, self._embeddings(request))
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _chat(self, request: dict) -> dict:
+        prompt = request["messages"][-1]["content"]
+        articles = BATCH_ARTICLE.findall(prompt)
+        if "Question:" in prompt:
+            answer = "The first result best answers the query."
+        elif articles:
+            answer = json.dumps([{"id": int(number), "summary": f"Summary of {title}", "topics": topics_in(title)}
+                                 for number, title in articles])
+        elif "Title:" in prompt:
+            title = TITLE_LINE.search(prompt).group(1)
+            answer = json.dumps({"summary": f"Summary of {title}", "topics": topics_in(title)})
+        else:
+            answer = "The first result best answers the query."
+        prompt_tokens = len(prompt) // 4 + 1
+        completion_tokens = len(answer) // 4 + 1
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": answer}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def _stream_chat(self, completion: dict):
+        # Server-sent events over chunked encoding, one word per chunk, then
+        # the usage chunk that stream_options.include_usage asks for.
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        base = {key: completion[key] for key in ("id", "created", "model")}
+        base["object"] = "chat.completion.chunk"
+        words = re.findall(r"\S+\s*", completion["choices"][0]["message"]["content"])
+        for i, word in enumerate(words):
+            time.sleep(self.token_latency)
+            delta = {"role": "assistant", "content": word} if i == 0 else {"content": word}
+            self._write_event({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+        self._write_event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self._write_event({**base, "choices": [], "usage": completion["usage"]})
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_event(self, payload: dict):
+        self._write_chunk(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _embeddings(self, request: dict) -> dict:
+        inputs = request["input"]
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dimensions = request.get("dimensions") or self.dimensions
+        tokens = sum(len(item) if isinstance(item, list) else len(item) // 4 + 1 for item in inputs)
+        return {
+            "object": "list",
+            "model": request.get("model", "stub"),
+            "data": [{"object": "embedding", "index": i, "embedding": hashed_vector(item, dimensions)}
+                     for i, item in enumerate(inputs)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+
+def start_server(handler: type, **settings) -> tuple:
+    handler = type(handler.__name__, (handler,), settings)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
@@ -0,0 +1,114 @@
+import argparse
+import http.client
+import json
+import socket
+import sys
+from typing import Iterator, Optional
+
+from utils.text_utils import format_search_results
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float = 60):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def _connect(host: str, port: int, socket_path: str, timeout: float) -> http.client.HTTPConnection:
+    if socket_path:
+        return UnixHTTPConnection(socket_path, timeout=timeout)
+    return http.client.HTTPConnection(host, port, timeout=timeout)
+
+
+def send_search(search_type: str, query: str, k: int = 3, host: str = "127.0.0.1", port: int = 8765,
+                socket_path: str = "", timeout: float = 120, filters: Optional[dict] = None) -> dict:
+    connection = _connect(host, port, socket_path, timeout)
+    try:
+        body = json.dumps({"search": search_type, "query": query, "k": k, **(filters or {})})
+        connection.request("POST", "/search", body=body, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        payload = json.loads(response.read().decode("utf-8"))
+        if response.status != 200:
+            raise RuntimeError(payload.get("error", f"HTTP {response.status}"))
+        return payload
+    finally:
+        connection.close()
+
+
+def stream_search(search_type: str, query: str, k: int = 3, host: str = "127.0.0.1", port: int = 8765,
+                  socket_path: str = "", timeout: float = 120, filters: Optional[dict] = None) -> Iterator[dict]:
+    connection = _connect(host, port, socket_path, timeout)
+    try:
+        body = json.dumps({"search": search_type, "query": query, "k": k, "stream": True, **(filters or {})})
+        connection.request("POST", "/search", body=body, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        if response.status != 200:
+            payload = json.loads(response.read().decode("utf-8"))
+            raise RuntimeError(payload.get("error", f"HTTP {response.status}"))
+        for line in response:
+            if not line.strip():
+                continue
+            message = json.loads(line.decode("utf-8"))
+            if "error" in message:
+                raise RuntimeError(message["error"])
+            yield message
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a search to a running server.py.")
+    parser.add_argument('--search', choices=['basic', 'rag', 'contextual'], default='basic',
+                        help="Search type: 'basic' for direct search, 'rag' for RAG-based search, 'contextual' for history-based augmentation")
+    parser.add_argument('--query', type=str, required=True, help="Search query")
+    parser.add_argument('--k', type=int, default=3, help="Number of results to retrieve")
+    parser.add_argument('--host', type=str, default="127.0.0.1", help="Server address")
+    parser.add_argument('--port', type=int, default=8765, help="Server port")
+    parser.add_argument('--socket', type=str, default="", help="Connect to this Unix socket instead of TCP")
+    parser.add_argument('--no_stream', action='store_true',
+                        help="Wait for the whole RAG answer instead of printing it as it is generated")
+    parser.add_argument('--topics', nargs='*', default=[], help="Only return articles with one of these topics")
+    parser.add_argument('--domains', nargs='*', default=[], help="Only return articles from these sites")
+    parser.add_argument('--published_after', type=str, default="",
+                        help="Only return articles whose URL is dated on or after this day (YYYY-MM-DD)")
+    parser.add_argument('--published_before', type=str, default="",
+                        help="Only return articles whose URL is dated on or before this day (YYYY-MM-DD)")
+    args = parser.parse_args()
+    filters = {field: getattr(args, field) for field in ('topics', 'domains', 'published_after', 'published_before')
+               if getattr(args, field)}
+
+    if args.search != 'basic' and not args.no_stream:
+        try:
+            for message in stream_search(args.search, args.query, args.k, args.host, args.port, args.socket,
+                                         filters=filters):
+                if "augmented_query" in message:
+                    print(f"Augmented query: {message['augmented_query']}\n")
+                print(message.get("delta", ""), end="", flush=True)
+        except (OSError, RuntimeError) as e:
+            print(f"\nSearch failed: {e}", file=sys.stderr)
+            sys.exit(1)
+        print()
+        return
+
+    try:
+        response = send_search(args.search, args.query, args.k, args.host, args.port, args.socket, filters=filters)
+    except (OSError, RuntimeError) as e:
+        print(f"Search failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if "augmented_query" in response:
+        print(f"Augmented query: {response['augmented_query']}\n")
+    if args.search == 'basic':
+        results = response.get("results", [])
+        print(format_search_results(results) if results else "No results found for basic search.")
+    else:
+        print(response.get("answer", ""))
+
+
+if __name__ == "__main__":
+    main()
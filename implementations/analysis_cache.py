@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from utils.metrics import METRICS
+
+
+class AnalysisCache:
+    def __init__(self, path: str = "analysis_cache.db"):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS analyses (
+                   model TEXT NOT NULL,
+                   prompt_version TEXT NOT NULL,
+                   content_hash TEXT NOT NULL,
+                   summary TEXT NOT NULL,
+                   topics TEXT NOT NULL,
+                   created REAL NOT NULL,
+                   PRIMARY KEY (model, prompt_version, content_hash)
+               ) WITHOUT ROWID"""
+        )
+        # Contextual searches repeat the same recent history and query often,
+        # so their augmented queries are kept alongside the analyses.
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS augmentations (
+                   model TEXT NOT NULL,
+                   prompt_version TEXT NOT NULL,
+                   request_hash TEXT NOT NULL,
+                   augmented TEXT NOT NULL,
+                   created REAL NOT NULL,
+                   PRIMARY KEY (model, prompt_version, request_hash)
+               ) WITHOUT ROWID"""
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def content_hash(title: str, text: str) -> str:
+        return hashlib.sha256(f"{title}\n{text}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, prompt_version: str, title: str, text: str) -> Optional[Tuple[str, List[str]]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, topics FROM analyses WHERE model = ? AND prompt_version = ? AND content_hash = ?",
+                (model, prompt_version, self.content_hash(title, text))
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                METRICS.inc("cache_misses_total", cache="analysis")
+                return None
+            self.hits += 1
+        METRICS.inc("cache_hits_total", cache="analysis")
+        return row[0], json.loads(row[1])
+
+    @staticmethod
+    def request_hash(history: List[str], query: str) -> str:
+        return hashlib.sha256(json.dumps([history, query], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get_augmentation(self, model: str, prompt_version: str, history: List[str], query: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT augmented FROM augmentations WHERE model = ? AND prompt_version = ? AND request_hash = ?",
+                (model, prompt_version, self.request_hash(history, query))
+            ).fetchone()
+        METRICS.inc("cache_hits_total" if row is not None else "cache_misses_total", cache="augmentation")
+        return row[0] if row is not None else None
+
+    def put_augmentation(self, model: str, prompt_version: str, history: List[str], query: str,
+                         augmented: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO augmentations VALUES (?, ?, ?, ?, ?)",
+                (model, prompt_version, self.request_hash(history, query), augmented, time.time())
+            )
+            self._conn.commit()
+
+    def put(self, model: str, prompt_version: str, title: str, text: str, summary: str, topics: List[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?, ?)",
+                (model, prompt_version, self.content_hash(title, text), summary, json.dumps(topics), time.time())
+            )
+            self._conn.commit()
+
+    def drop_other_versions(self, prompt_version: str, augment_prompt_version: str) -> None:
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM analyses WHERE prompt_version != ?", (prompt_version,)
+            ).rowcount
+            augmentations = self._conn.execute(
+                "DELETE FROM augmentations WHERE prompt_version != ?", (augment_prompt_version,)
+            ).rowcount
+            self._conn.commit()
+        if deleted or augmentations:
+            logging.info(f"Dropped {deleted} analyses and {augmentations} augmented queries cached under "
+                         f"other prompt versions")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM analyses")
+            self._conn.execute("DELETE FROM augmentations")
+            self._conn.commit()
+        logging.info(f"Cleared analysis cache {self.path}")
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
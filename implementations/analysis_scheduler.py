@@ -0,0 +1,177 @@
+import concurrent.futures
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Tuple
+
+import openai
+
+from implementations.genai_analyser import ANALYSIS_MAX_TOKENS, GenAIAnalyzer
+from utils.metrics import METRICS
+from utils.text_utils import estimate_tokens
+
+PROMPT_OVERHEAD_TOKENS = 150
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = requests_per_minute
+        self._tokens = tokens_per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int) -> None:
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed = now - self._updated
+                self._updated = now
+                if self.requests_per_minute:
+                    self._requests = min(self.requests_per_minute,
+                                         self._requests + elapsed * self.requests_per_minute / 60)
+                if self.tokens_per_minute:
+                    self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+                wait = 0.0
+                if self.requests_per_minute and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+                if self.tokens_per_minute and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+                if wait == 0.0:
+                    if self.requests_per_minute:
+                        self._requests -= 1
+                    if self.tokens_per_minute:
+                        self._tokens -= tokens
+                    return
+            time.sleep(wait)
+
+
+class AnalysisScheduler:
+    def __init__(self, analyzer: GenAIAnalyzer, max_concurrency: int = 4, requests_per_minute: float = 0,
+                 tokens_per_minute: float = 0, batch_size: int = 1, short_article_tokens: int = 1500,
+                 batch_wait: float = 0.5, max_retries: int = 5):
+        self.analyzer = analyzer
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.batch_size = max(1, batch_size)
+        self.short_article_tokens = short_article_tokens
+        self.batch_wait = batch_wait
+        self.max_retries = max_retries
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        self._pending = []
+        self._pending_lock = threading.Lock()
+
+    def analyze(self, title: str, text: str) -> Tuple[str, List[str]]:
+        cached = self.analyzer.cached_analysis(title, text)
+        if cached is not None:
+            logging.info("Using cached analysis.")
+            return cached
+
+        if self.batch_size > 1 and estimate_tokens(title + text) <= self.short_article_tokens:
+            return self._analyze_batched(title, text)
+        return self._analyze_single(title, text)
+
+    def _analyze_batched(self, title: str, text: str) -> Tuple[str, List[str]]:
+        future = Future()
+        with self._pending_lock:
+            self._pending.append((title, text, future))
+            batch = self._take_batch() if len(self._pending) >= self.batch_size else None
+        if batch:
+            self._run_batch(batch)
+
+        # Whoever waits longest without the batch filling up sends what has
+        # been collected so far.
+        try:
+            return future.result(timeout=self.batch_wait)
+        except concurrent.futures.TimeoutError:
+            with self._pending_lock:
+                batch = self._take_batch() if any(item[2] is future for item in self._pending) else None
+            if batch:
+                self._run_batch(batch)
+            return future.result()
+
+    def _take_batch(self) -> list:
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        return batch
+
+    def _run_batch(self, batch: list) -> None:
+        try:
+            self._analyze_batch(batch)
+        finally:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_result(("", []))
+
+    def _analyze_batch(self, batch: list) -> None:
+        if len(batch) == 1:
+            title, text, future = batch[0]
+            future.set_result(self._analyze_single(title, text))
+            return
+
+        articles = [(title, text) for title, text, _ in batch]
+        tokens = sum(estimate_tokens(title + text) for title, text in articles) \
+            + PROMPT_OVERHEAD_TOKENS + ANALYSIS_MAX_TOKENS * len(articles)
+        try:
+            results = self._call(lambda: self.analyzer.request_batch_analysis(articles), tokens)
+        except Exception as e:
+            logging.error(f"Batch analysis of {len(batch)} articles failed, retrying individually: {str(e)}")
+            results = [("", [])] * len(batch)
+
+        for (title, text, future), (summary, topics) in zip(batch, results):
+            if summary and topics:
+                self.analyzer.store_analysis(title, text, summary, topics)
+                future.set_result((summary, topics))
+            else:
+                future.set_result(self._analyze_single(title, text))
+
+    def _analyze_single(self, title: str, text: str) -> Tuple[str, List[str]]:
+        tokens = estimate_tokens(title + text) + PROMPT_OVERHEAD_TOKENS + ANALYSIS_MAX_TOKENS
+        try:
+            summary, topics = self._call(lambda: self.analyzer.request_analysis(title, text), tokens)
+        except json.JSONDecodeError as e:
+            logging.error("JSON parsing error: %s", e)
+            return "", []
+        except Exception as e:
+            logging.error("GenAI analysis failed after retries: %s", e)
+            return "", []
+        self.analyzer.store_analysis(title, text, summary, topics)
+        return summary, topics
+
+    def _call(self, request, tokens: int):
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(tokens)
+            with self._slots:
+                try:
+                    return request()
+                except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e:
+                    error = e
+                except openai.APIStatusError as e:
+                    if e.status_code < 500:
+                        raise
+                    error = e
+
+            if attempt >= self.max_retries:
+                raise error
+            delay = self._retry_delay(error, attempt)
+            METRICS.inc("llm_retries_total", error=type(error).__name__)
+            logging.warning(f"GenAI request failed ({error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _retry_delay(error: Exception, attempt: int) -> float:
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
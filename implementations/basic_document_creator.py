@@ -2,12 +2,14 @@ from typing import List
 from langchain_core.documents import Document
 
 from interfaces.document_creator import DocumentCreator
+from utils.text_utils import document_id
 
 class BasicDocumentCreator(DocumentCreator):
 
     def create_document(self, title: str, summary: str, topics: List[str], text: str, url: str) -> Document:
         content = f"Summary: {summary}\nTopics: {', '.join(topics)}"
         return Document(
+            id=document_id(url, title, text),
             page_content=content,
             metadata={"title": title, "summary": summary, "topics": topics, "text": text, "url": url}
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,116 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+from utils.metrics import METRICS
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings: Embeddings, path: str = "embedding_cache.db", memory_size: int = 10000):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.dimensions = getattr(embeddings, "dimensions", None) or 0
+        self.memory_size = memory_size
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                   model TEXT NOT NULL,
+                   dimensions INTEGER NOT NULL,
+                   text_hash TEXT NOT NULL,
+                   vector BLOB NOT NULL,
+                   PRIMARY KEY (model, dimensions, text_hash)
+               ) WITHOUT ROWID"""
+        )
+        self._conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [self._hash(text) for text in texts]
+        found = self._lookup(set(hashes))
+
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in found and text_hash not in missing:
+                missing[text_hash] = text
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        METRICS.inc("cache_hits_total", len(texts) - len(missing), cache="embedding")
+        METRICS.inc("cache_misses_total", len(missing), cache="embedding")
+
+        if missing:
+            logging.info(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            found.update(computed)
+
+        return [list(found[text_hash]) for text_hash in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        text_hash = self._hash(text)
+        found = self._lookup({text_hash})
+        if text_hash in found:
+            with self._lock:
+                self.hits += 1
+            METRICS.inc("cache_hits_total", cache="embedding")
+            return list(found[text_hash])
+
+        with self._lock:
+            self.misses += 1
+        METRICS.inc("cache_misses_total", cache="embedding")
+        vector = self.embeddings.embed_query(text)
+        self._store({text_hash: vector})
+        return vector
+
+    def _hash(self, text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, hashes: set) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for text_hash in hashes:
+                if text_hash in self._memory:
+                    self._memory.move_to_end(text_hash)
+                    found[text_hash] = self._memory[text_hash]
+
+            pending = [text_hash for text_hash in hashes if text_hash not in found]
+            for start in range(0, len(pending), 500):
+                chunk = pending[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND dimensions = ? "
+                    f"AND text_hash IN ({','.join('?' * len(chunk))})",
+                    [self.model, self.dimensions, *chunk]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[text_hash] = vector
+                    self._remember(text_hash, vector)
+        return found
+
+    def _store(self, vectors: Dict[str, List[float]]) -> None:
+        with self._lock:
+            rows = []
+            for text_hash, vector in vectors.items():
+                packed = array("f", vector)
+                rows.append((self.model, self.dimensions, text_hash, packed.tobytes()))
+                self._remember(text_hash, packed)
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def _remember(self, text_hash: str, vector: array) -> None:
+        self._memory[text_hash] = vector
+        self._memory.move_to_end(text_hash)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
@@ -0,0 +1,86 @@
+import logging
+from typing import Dict, List
+
+from utils.text_utils import estimate_tokens, tokenize
+
+# Fields in the order they are kept: the title and URL of a result are
+# always included, its summary and topics next, and the article text only
+# gets whatever budget is left.
+HEADER_FIELDS = (("title", "Title"), ("url", "URL"), ("summary", "Summary"), ("topics", "Topics"))
+DUPLICATE_PREFIX_CHARS = 500
+
+
+def _field(item: Dict, field: str) -> str:
+    value = item.get(field, "")
+    return ", ".join(value) if isinstance(value, list) else str(value)
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    if estimate_tokens(text) <= tokens:
+        return text
+    cut = text[:max(0, tokens * 4 - 1)]
+    if " " in cut:
+        cut = cut[:cut.rindex(" ")]
+    return cut + "…" if cut else ""
+
+
+class ContextBuilder:
+    def __init__(self, token_budget: int = 1500, max_content_tokens: int = 400, duplicate_threshold: float = 0.8):
+        self.token_budget = token_budget
+        self.max_content_tokens = max_content_tokens
+        self.duplicate_threshold = duplicate_threshold
+
+    def build(self, results: List[Dict], texts: Dict[str, str]) -> str:
+        items = self._deduplicate(results, texts)
+        remaining = self.token_budget
+
+        blocks = []
+        for item in items:
+            lines = []
+            for field, label in HEADER_FIELDS:
+                line = f"{label}: {_field(item, field)}"
+                cost = estimate_tokens(line)
+                if cost > remaining and field in ("summary", "topics"):
+                    line = truncate_to_tokens(line, remaining)
+                    cost = estimate_tokens(line) if line else 0
+                if cost > remaining or not line:
+                    break
+                lines.append(line)
+                remaining -= cost
+            if len(lines) < 2:
+                break
+            blocks.append((item, lines))
+
+        # Article text is filled in last, in rank order, so the best results
+        # get the most of it and lower ranked ones are cut first.
+        for item, lines in blocks:
+            allowance = min(remaining, self.max_content_tokens)
+            content = truncate_to_tokens(texts.get(item["id"], ""), allowance - 2) if allowance > 2 else ""
+            if content:
+                lines.append(f"Content: {content}")
+                remaining -= estimate_tokens(lines[-1])
+
+        logging.info(f"RAG context: {len(blocks)} of {len(results)} results, "
+                     f"{self.token_budget - remaining} of {self.token_budget} tokens")
+        return "\n\n".join("\n".join(lines) for _, lines in blocks)
+
+    def _deduplicate(self, results: List[Dict], texts: Dict[str, str]) -> List[Dict]:
+        # The same story syndicated to several sites, or re-indexed under a new
+        # URL, would otherwise spend the budget twice on one piece of news.
+        kept = []
+        signatures = []
+        for result in results:
+            signature = set(tokenize(f"{_field(result, 'title')} {_field(result, 'summary')} "
+                                     f"{texts.get(result['id'], '')[:DUPLICATE_PREFIX_CHARS]}"))
+            if any(self._similarity(signature, other) >= self.duplicate_threshold for other in signatures):
+                logging.info(f"Dropping near-duplicate RAG result {result.get('url', result['id'])}")
+                continue
+            kept.append(result)
+            signatures.append(signature)
+        return kept
+
+    @staticmethod
+    def _similarity(first: set, second: set) -> float:
+        if not first or not second:
+            return 0.0
+        return len(first & second) / len(first | second)
@@ -0,0 +1,155 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from utils.text_utils import normalize_url, tokenize
+
+SHINGLE_SIZE = 5
+MINHASH_PERMUTATIONS = 128
+# 32 bands of 4 rows: pages at 0.8 Jaccard similarity share a bucket with
+# near certainty, pages below about 0.4 rarely do.
+LSH_BANDS = 32
+_PRIME = (1 << 31) - 1
+
+
+class DuplicateIndex:
+    def __init__(self, path: str = "duplicates.db", threshold: float = 0.8,
+                 permutations: int = MINHASH_PERMUTATIONS, bands: int = LSH_BANDS, seed: int = 0):
+        if permutations % bands:
+            raise ValueError(f"{permutations} MinHash permutations cannot be split into {bands} bands")
+        self.path = path
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = permutations // bands
+        # Seeded so signatures stored by earlier runs stay comparable.
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, permutations, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, permutations, dtype=np.uint64)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS signatures (
+                   url TEXT PRIMARY KEY,
+                   fingerprint TEXT NOT NULL,
+                   signature BLOB NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS signatures_fingerprint ON signatures (fingerprint)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bands (band INTEGER NOT NULL, bucket BLOB NOT NULL, url TEXT NOT NULL, "
+            "PRIMARY KEY (band, bucket, url)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bands_url ON bands (url)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS aliases (
+                   url TEXT PRIMARY KEY,
+                   canonical TEXT NOT NULL,
+                   similarity REAL NOT NULL,
+                   created REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS aliases_canonical ON aliases (canonical)")
+        self._conn.commit()
+
+    def signature(self, tokens: List[str]) -> np.ndarray:
+        shingles = {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles)) % _PRIME
+        return ((hashes[:, None] * self._a + self._b) % _PRIME).min(axis=0).astype(np.uint32)
+
+    def _buckets(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def check(self, url: str, text: str) -> Optional[Tuple[str, float]]:
+        # Returns the canonical URL and estimated similarity when the text is a
+        # copy of a page seen before; otherwise registers the page as canonical.
+        tokens = tokenize(text)
+        if not tokens:
+            return None
+        key = normalize_url(url)
+        fingerprint = hashlib.sha1(" ".join(tokens).encode("utf-8")).hexdigest()
+        signature = self.signature(tokens)
+        buckets = self._buckets(signature)
+
+        with self._lock:
+            match = self._find(key, fingerprint, signature, buckets)
+            self._delete(key)
+            if match is not None:
+                self._conn.execute("INSERT INTO aliases VALUES (?, ?, ?, ?)", (key, match[0], match[1], time.time()))
+            else:
+                self._conn.execute("INSERT INTO signatures VALUES (?, ?, ?)", (key, fingerprint, signature.tobytes()))
+                self._conn.executemany("INSERT OR IGNORE INTO bands VALUES (?, ?, ?)",
+                                       [(band, bucket, key) for band, bucket in buckets])
+            self._conn.commit()
+        return match
+
+    def _find(self, key: str, fingerprint: str, signature: np.ndarray,
+              buckets: List[Tuple[int, bytes]]) -> Optional[Tuple[str, float]]:
+        row = self._conn.execute("SELECT url FROM signatures WHERE fingerprint = ? AND url != ? LIMIT 1",
+                                 (fingerprint, key)).fetchone()
+        if row is not None:
+            return row[0], 1.0
+
+        candidates = set()
+        for band, bucket in buckets:
+            candidates.update(url for (url,) in self._conn.execute(
+                "SELECT url FROM bands WHERE band = ? AND bucket = ?", (band, bucket)))
+        candidates.discard(key)
+        best = None
+        for url in candidates:
+            stored = self._conn.execute("SELECT signature FROM signatures WHERE url = ?", (url,)).fetchone()
+            if stored is None:
+                continue
+            similarity = float(np.mean(np.frombuffer(stored[0], dtype=np.uint32) == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = url, similarity
+        return best
+
+    def _delete(self, key: str) -> None:
+        self._conn.execute("DELETE FROM signatures WHERE url = ?", (key,))
+        self._conn.execute("DELETE FROM bands WHERE url = ?", (key,))
+        self._conn.execute("DELETE FROM aliases WHERE url = ?", (key,))
+
+    def remove(self, url: str) -> None:
+        key = normalize_url(url)
+        with self._lock:
+            self._delete(key)
+            self._conn.execute("DELETE FROM aliases WHERE canonical = ?", (key,))
+            self._conn.commit()
+
+    def prune(self, urls: Iterable[str]) -> int:
+        # Pages no longer listed leave the index, so their copies are indexed
+        # in their place instead of pointing at a document that is gone.
+        keep = {normalize_url(url) for url in urls}
+        with self._lock:
+            stale = [url for (url,) in self._conn.execute("SELECT url FROM signatures UNION SELECT url FROM aliases")
+                     if url not in keep]
+            for url in stale:
+                self._delete(url)
+            self._conn.execute("DELETE FROM aliases WHERE canonical NOT IN (SELECT url FROM signatures)")
+            self._conn.commit()
+        if stale:
+            logging.info(f"Dropped {len(stale)} unlisted pages from the duplicate index")
+        return len(stale)
+
+    def aliases(self, url: str) -> List[str]:
+        with self._lock:
+            return [alias for (alias,) in self._conn.execute(
+                "SELECT url FROM aliases WHERE canonical = ? ORDER BY url", (normalize_url(url),))]
+
+    def stats(self) -> dict:
+        with self._lock:
+            canonical = self._conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+            aliases = self._conn.execute("SELECT COUNT(*) FROM aliases").fetchone()[0]
+        return {"canonical": canonical, "aliases": aliases}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
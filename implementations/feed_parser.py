@@ -0,0 +1,95 @@
+import datetime
+import email.utils
+import xml.etree.ElementTree as ElementTree
+from typing import Iterator, List, NamedTuple, Optional
+from urllib.parse import urljoin
+
+FEED_KINDS = ("rss", "rdf", "feed", "urlset", "sitemapindex")
+
+
+class FeedEntry(NamedTuple):
+    url: str
+    published: Optional[datetime.datetime] = None
+
+
+class Feed(NamedTuple):
+    kind: str
+    entries: List[FeedEntry]
+    # Child sitemaps listed by a sitemap index.
+    sitemaps: List[FeedEntry]
+
+
+def _name(element: ElementTree.Element) -> str:
+    # RSS, Atom and sitemaps each come with and without namespaces, so
+    # elements are matched on their local name only.
+    return element.tag.rsplit("}", 1)[-1].lower()
+
+
+def _children(element: ElementTree.Element, name: str) -> Iterator[ElementTree.Element]:
+    return (child for child in element if _name(child) == name)
+
+
+def _text(element: ElementTree.Element, *names: str) -> str:
+    for name in names:
+        for child in element.iter():
+            if child is not element and _name(child) == name and (child.text or "").strip():
+                return child.text.strip()
+    return ""
+
+
+def parse_date(value: str) -> Optional[datetime.datetime]:
+    if not value:
+        return None
+    try:
+        # RSS uses RFC 822 dates, Atom and sitemaps ISO 8601 ones.
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+def _rss_link(item: ElementTree.Element) -> str:
+    link = _text(item, "link")
+    if link:
+        return link
+    for guid in _children(item, "guid"):
+        if guid.get("isPermaLink", "true") != "false" and (guid.text or "").strip().startswith("http"):
+            return guid.text.strip()
+    return ""
+
+
+def _atom_link(entry: ElementTree.Element) -> str:
+    links = list(_children(entry, "link"))
+    for link in links:
+        if link.get("rel", "alternate") == "alternate" and link.get("href"):
+            return link.get("href")
+    return links[0].get("href", "") if links else ""
+
+
+def parse_feed(body: bytes, base_url: str = "") -> Feed:
+    root = ElementTree.fromstring(body)
+    kind = _name(root)
+    entries, sitemaps = [], []
+    if kind in ("rss", "rdf"):
+        for item in root.iter():
+            if _name(item) == "item":
+                entries.append(FeedEntry(_rss_link(item), parse_date(_text(item, "pubdate", "date", "published"))))
+    elif kind == "feed":
+        for entry in _children(root, "entry"):
+            entries.append(FeedEntry(_atom_link(entry), parse_date(_text(entry, "published", "updated"))))
+    elif kind == "urlset":
+        for url in _children(root, "url"):
+            entries.append(FeedEntry(_text(url, "loc"), parse_date(_text(url, "publication_date", "lastmod"))))
+    elif kind == "sitemapindex":
+        for sitemap in _children(root, "sitemap"):
+            sitemaps.append(FeedEntry(_text(sitemap, "loc"), parse_date(_text(sitemap, "lastmod"))))
+    else:
+        raise ValueError(f"Unrecognised feed format <{kind}>, expected one of {FEED_KINDS}")
+
+    def resolve(found: List[FeedEntry]) -> List[FeedEntry]:
+        return [entry._replace(url=urljoin(base_url, entry.url)) for entry in found if entry.url]
+
+    return Feed(kind, resolve(entries), resolve(sitemaps))
@@ -0,0 +1,85 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+class FetchCache:
+    def __init__(self, path: str = "fetch_cache.db", max_size_mb: float = 512):
+        self.path = path
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                   url TEXT PRIMARY KEY,
+                   body TEXT NOT NULL,
+                   etag TEXT,
+                   last_modified TEXT,
+                   document TEXT,
+                   size INTEGER NOT NULL,
+                   accessed REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed)")
+        self._conn.commit()
+
+    def get(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE pages SET accessed = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+        return {"body": row[0], "etag": row[1], "last_modified": row[2]}
+
+    def put(self, url: str, body: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        # A new body invalidates the document analysed from the previous one.
+        size = len(body.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, body, etag, last_modified, document, size, accessed) "
+                "VALUES (?, ?, ?, ?, NULL, ?, ?)",
+                (url, body, etag, last_modified, size, time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def get_document(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT document FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def put_document(self, url: str, document: Dict) -> None:
+        payload = json.dumps(document)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pages SET document = ?, size = length(CAST(body AS BLOB)) + ? WHERE url = ?",
+                (payload, len(payload.encode("utf-8")), url)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for url, size in self._conn.execute("SELECT url, size FROM pages ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+            total -= size
+            evicted += 1
+        logging.info(f"Evicted {evicted} pages from fetch cache {self.path}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,156 @@
+import logging
+import random
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.text_utils import normalize_url
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+class Frontier:
+    def __init__(self, path: str = "frontier.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS sources (
+                   url TEXT PRIMARY KEY,
+                   interval REAL NOT NULL,
+                   next_poll REAL NOT NULL,
+                   etag TEXT,
+                   last_modified TEXT,
+                   failures INTEGER NOT NULL DEFAULT 0
+               )"""
+        )
+        # Every article URL ever discovered, keyed by its normalized form, so
+        # a page listed by several feeds or polls is only ingested once.
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS urls (
+                   key TEXT PRIMARY KEY,
+                   url TEXT NOT NULL,
+                   source TEXT NOT NULL,
+                   discovered REAL NOT NULL,
+                   state TEXT NOT NULL,
+                   attempts INTEGER NOT NULL DEFAULT 0,
+                   next_attempt REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS urls_pending ON urls (state, next_attempt, discovered)")
+        self._conn.commit()
+
+    def sync_sources(self, sources: Dict[str, float], jitter: float = 0.2) -> None:
+        # New sources are spread over the first interval instead of all being
+        # polled at start-up; sources no longer listed are forgotten.
+        now = time.time()
+        with self._lock:
+            known = {url for (url,) in self._conn.execute("SELECT url FROM sources")}
+            for url, interval in sources.items():
+                if url in known:
+                    self._conn.execute("UPDATE sources SET interval = ? WHERE url = ?", (interval, url))
+                else:
+                    self._conn.execute("INSERT INTO sources (url, interval, next_poll) VALUES (?, ?, ?)",
+                                       (url, interval, now + random.uniform(0, interval * jitter)))
+            removed = known - set(sources)
+            self._conn.executemany("DELETE FROM sources WHERE url = ?", [(url,) for url in removed])
+            self._conn.commit()
+        if removed:
+            logging.info(f"Stopped polling {len(removed)} sources no longer listed")
+
+    def due_sources(self, now: Optional[float] = None) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, interval, etag, last_modified, failures FROM sources WHERE next_poll <= ? "
+                "ORDER BY next_poll", (time.time() if now is None else now,)
+            ).fetchall()
+        return [{"url": url, "interval": interval, "etag": etag, "last_modified": last_modified,
+                 "failures": failures} for url, interval, etag, last_modified, failures in rows]
+
+    def next_poll(self) -> Optional[float]:
+        with self._lock:
+            return self._conn.execute("SELECT MIN(next_poll) FROM sources").fetchone()[0]
+
+    def schedule(self, url: str, next_poll: float, failures: int = 0, etag: Optional[str] = None,
+                 last_modified: Optional[str] = None) -> None:
+        with self._lock:
+            if failures:
+                # Validators from the last successful poll stay valid.
+                self._conn.execute("UPDATE sources SET next_poll = ?, failures = ? WHERE url = ?",
+                                   (next_poll, failures, url))
+            else:
+                self._conn.execute(
+                    "UPDATE sources SET next_poll = ?, failures = 0, etag = ?, last_modified = ? WHERE url = ?",
+                    (next_poll, etag, last_modified, url))
+            self._conn.commit()
+
+    def discover(self, urls: Iterable[str], source: str) -> int:
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO urls (key, url, source, discovered, state, next_attempt) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(normalize_url(url), url, source, now, PENDING, now) for url in urls]
+            )
+            added = self._conn.total_changes - before
+            self._conn.commit()
+        return added
+
+    def pending(self, limit: int, now: Optional[float] = None) -> List[Tuple[str, float]]:
+        # Oldest discoveries first, with the time each one was discovered.
+        with self._lock:
+            return self._conn.execute(
+                "SELECT url, discovered FROM urls WHERE state = ? AND next_attempt <= ? "
+                "ORDER BY discovered LIMIT ?", (PENDING, time.time() if now is None else now, limit)
+            ).fetchall()
+
+    def next_attempt(self, after: float) -> Optional[float]:
+        # When the next failed page is due for another attempt.
+        with self._lock:
+            return self._conn.execute("SELECT MIN(next_attempt) FROM urls WHERE state = ? AND next_attempt > ?",
+                                      (PENDING, after)).fetchone()[0]
+
+    def mark_done(self, urls: List[str]) -> None:
+        with self._lock:
+            self._conn.executemany("UPDATE urls SET state = ?, attempts = attempts + 1 WHERE key = ?",
+                                   [(DONE, normalize_url(url)) for url in urls])
+            self._conn.commit()
+
+    def mark_failed(self, urls: List[str], retry_after: float, max_attempts: int) -> int:
+        # Failed pages are retried later with a doubling delay, and given up
+        # on after max_attempts.
+        now = time.time()
+        given_up = 0
+        with self._lock:
+            for url in urls:
+                key = normalize_url(url)
+                row = self._conn.execute("SELECT attempts FROM urls WHERE key = ?", (key,)).fetchone()
+                attempts = (row[0] if row else 0) + 1
+                if attempts >= max_attempts:
+                    given_up += 1
+                    self._conn.execute("UPDATE urls SET state = ?, attempts = ? WHERE key = ?",
+                                       (FAILED, attempts, key))
+                else:
+                    self._conn.execute("UPDATE urls SET attempts = ?, next_attempt = ? WHERE key = ?",
+                                       (attempts, now + retry_after * 2 ** (attempts - 1), key))
+            self._conn.commit()
+        return given_up
+
+    def urls(self, state: str = DONE) -> List[str]:
+        with self._lock:
+            return [url for (url,) in self._conn.execute("SELECT url FROM urls WHERE state = ?", (state,))]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT state, COUNT(*) FROM urls GROUP BY state").fetchall())
+            sources = self._conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+        return {"sources": sources, **{state: counts.get(state, 0) for state in (PENDING, DONE, FAILED)}}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,38 +1,100 @@
 import json
 import os
-import openai
 import logging
-from openai import OpenAI
+import threading
+import time
+from typing import Iterator, Optional
+
 from interfaces.analyzer import Analyzer
-from langchain_openai import OpenAIEmbeddings
 
-from interfaces.store import VectorStore
-from utils.text_utils import extract_json
+from implementations.analysis_cache import AnalysisCache
+from implementations.context_builder import ContextBuilder
+
+from interfaces.store import SearchFilter, VectorStore
+from utils.metrics import METRICS
+from utils.text_utils import extract_json, extract_json_array
 
-GENAI_API_KEY = os.getenv("GENAI_API_KEY", "")
-if not GENAI_API_KEY:
-    raise ValueError("GENAI_API_KEY environment variable not set.")
+# Bump whenever a prompt changes so results cached for the old one are not reused.
+ANALYSIS_PROMPT_VERSION = "1"
+AUGMENT_PROMPT_VERSION = "1"
+ANALYSIS_MAX_TOKENS = 300
+RAG_CONTEXT_TOKENS = 1500
 
 class GenAIAnalyzer(Analyzer):
-    def __init__(self, model="openai/gpt-4o", httpReferer="https://openrouter.ai/api/v1"):
+    def __init__(self, model="openai/gpt-4o", httpReferer="https://openrouter.ai/api/v1",
+                 embedding_cache="embedding_cache.db", analysis_cache="analysis_cache.db", embeddings="openai",
+                 embedding_options=None, context_tokens=RAG_CONTEXT_TOKENS):
         self.model = model
-        self.client = OpenAI(
-            base_url=httpReferer,
-            api_key=GENAI_API_KEY
-        )
-        self.embeddings = OpenAIEmbeddings(
-            model="openai/text-embedding-3-large",
-            openai_api_key=GENAI_API_KEY,
-            openai_api_base=httpReferer,
-            model_kwargs={
-                "extra_headers": {
-                    "HTTP-Referer": httpReferer
-                },
-                "encoding_format": "float"
-            }
-        )
+        self.httpReferer = httpReferer
+        self.embedding_cache = embedding_cache
+        self.embeddings = embeddings
+        self.embedding_options = embedding_options or {}
+        self.context_builder = ContextBuilder(context_tokens)
+        self._client = None
+        self._embeddings = None
+        self._lock = threading.Lock()
+        self.analysis_cache = AnalysisCache(analysis_cache) if analysis_cache else None
+        if self.analysis_cache is not None:
+            self.analysis_cache.drop_other_versions(ANALYSIS_PROMPT_VERSION, AUGMENT_PROMPT_VERSION)
+
+    @staticmethod
+    def _api_key() -> str:
+        api_key = os.getenv("GENAI_API_KEY", "")
+        if not api_key:
+            raise ValueError("GENAI_API_KEY environment variable not set.")
+        return api_key
+
+    # The OpenAI SDK and langchain_openai are slow to import, so clients are
+    # only built the first time a request actually needs them.
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(
+                        base_url=self.httpReferer,
+                        api_key=self._api_key()
+                    )
+        return self._client
 
     def analyze(self, title: str, text: str) -> tuple:
+        cached = self.cached_analysis(title, text)
+        if cached is not None:
+            logging.info("Using cached analysis.")
+            return cached
+
+        import openai
+
+        try:
+            logging.info("Sending request to GenAI for analysis.")
+            summary, topics = self.request_analysis(title, text)
+            logging.info("Analysis completed successfully.")
+            self.store_analysis(title, text, summary, topics)
+            return summary, topics
+
+        except json.JSONDecodeError as e:
+            logging.error("JSON parsing error: %s", e)
+            return "", []
+
+        except openai.OpenAIError as e:
+            logging.error("GenAI API error: %s", e)
+            return "", []
+
+        except Exception as e:
+            logging.error("Unexpected error: %s", e)
+            return "", []
+
+    def cached_analysis(self, title: str, text: str):
+        if self.analysis_cache is None:
+            return None
+        return self.analysis_cache.get(self.model, ANALYSIS_PROMPT_VERSION, title, text)
+
+    def store_analysis(self, title: str, text: str, summary: str, topics: list) -> None:
+        if self.analysis_cache is not None and summary and topics:
+            self.analysis_cache.put(self.model, ANALYSIS_PROMPT_VERSION, title, text, summary, topics)
+
+    def request_analysis(self, title: str, text: str) -> tuple:
         prompt = f"""
         You are a news analysis expert. Provide a short summary and a list of key topics for the following news article.
 
@@ -46,47 +108,142 @@ class GenAIAnalyzer(Analyzer):
         }}
         """
 
-        try:
-            logging.info("Sending request to GenAI for analysis.")
+        answer_text = self._complete("llm_analysis", prompt, ANALYSIS_MAX_TOKENS)
+        logging.info("Received response from GenAI.")
+
+        result = json.loads(extract_json(answer_text))
+        return result.get("summary", ""), result.get("topics", [])
+
+    def request_batch_analysis(self, articles: list) -> list:
+        articles_str = "\n\n".join(
+            f"Article {i + 1}\nTitle: {title}\nText: {text}" for i, (title, text) in enumerate(articles)
+        )
+        prompt = f"""
+        You are a news analysis expert. Provide a short summary and a list of key topics for each of the following news articles.
+
+        {articles_str}
+
+        Return the result as a JSON array with one object per article, in the same order:
+        [
+            {{
+                "id": 1,
+                "summary": "Short summary of the news",
+                "topics": ["topic1", "topic2", ...]
+            }},
+            ...
+        ]
+        """
+
+        answer_text = self._complete("llm_batch_analysis", prompt, ANALYSIS_MAX_TOKENS * len(articles))
+        logging.info("Received batch response from GenAI for %d articles.", len(articles))
+
+        results = json.loads(extract_json_array(answer_text))
+        by_id = {}
+        for item in results:
+            if not isinstance(item, dict):
+                continue
+            # Models sometimes quote the ids, e.g. "1" instead of 1.
+            try:
+                by_id[int(item.get("id"))] = item
+            except (TypeError, ValueError):
+                continue
+        if len(by_id) != len(articles) and len(results) == len(articles):
+            by_id = {i + 1: item for i, item in enumerate(results)}
+        return [
+            (by_id[i + 1].get("summary", ""), by_id[i + 1].get("topics", [])) if i + 1 in by_id else ("", [])
+            for i in range(len(articles))
+        ]
+
+    def _complete(self, operation: str, prompt: str, max_tokens: int = 300) -> str:
+        with METRICS.stage(operation):
             completion = self.client.chat.completions.create(
                 model=self.model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.3,
-                max_tokens=300
+                max_tokens=max_tokens
             )
-            answer_text = completion.choices[0].message.content.strip()
-            logging.info("Received response from GenAI.")
+        self._record_usage(operation, completion.usage)
+        return completion.choices[0].message.content.strip()
 
-            json_text = extract_json(answer_text)
-            result = json.loads(json_text)
+    def _stream(self, operation: str, prompt: str, max_tokens: int = 300) -> Iterator[str]:
+        start = time.perf_counter()
+        first_token = True
+        with METRICS.stage(operation):
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.3,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            usage = None
+            for chunk in stream:
+                usage = chunk.usage or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token:
+                        METRICS.observe("stage_seconds", time.perf_counter() - start, stage=f"{operation}_first_token")
+                        first_token = False
+                    yield chunk.choices[0].delta.content
+        self._record_usage(operation, usage)
 
-            summary = result.get("summary", "")
-            topics = result.get("topics", [])
+    @staticmethod
+    def _record_usage(operation: str, usage) -> None:
+        METRICS.inc("llm_requests_total", operation=operation)
+        if usage is not None:
+            METRICS.inc("llm_tokens_total", usage.prompt_tokens, kind="prompt", operation=operation)
+            METRICS.inc("llm_tokens_total", usage.completion_tokens, kind="completion", operation=operation)
 
-            logging.info("Analysis completed successfully.")
-            return summary, topics
+    def get_embedding_model(self):
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = self._create_embedding_model()
+        return self._embeddings
 
-        except json.JSONDecodeError as e:
-            logging.error("JSON parsing error: %s", e)
-            return "Error", [], f"Failed to parse JSON from the model response: {e}"
+    def _create_embedding_model(self):
+        if self.embeddings == "openai":
+            embeddings = self._create_openai_embeddings(**self.embedding_options)
+        else:
+            from implementations.registry import get_embeddings_class
+            embeddings = get_embeddings_class(self.embeddings)(**self.embedding_options)
+        # Hashed vectors are cheaper to recompute than to look up.
+        if self.embedding_cache and self.embeddings != "hashed":
+            from implementations.cached_embeddings import CachedEmbeddings
+            embeddings = CachedEmbeddings(embeddings, path=self.embedding_cache)
+        return embeddings
 
-        except openai.error.OpenAIError as e:
-            logging.error("GenAI API error: %s", e)
-            return "Error", [], f"GenAI API error: {e}"
+    def _create_openai_embeddings(self, dimensions: Optional[int] = None):
+        from langchain_openai import OpenAIEmbeddings
 
-        except Exception as e:
-            logging.error("Unexpected error: %s", e)
-            return "Error", [], f"Unexpected error: {e}"
+        api_key = self._api_key()
+        # text-embedding-3 models shorten their vectors server side when asked
+        # for fewer dimensions, at a small loss of accuracy.
+        return OpenAIEmbeddings(
+            model="openai/text-embedding-3-large",
+            dimensions=dimensions,
+            openai_api_key=api_key,
+            openai_api_base=self.httpReferer,
+            model_kwargs={
+                "extra_headers": {
+                    "HTTP-Referer": self.httpReferer
+                },
+                "encoding_format": "float"
+            }
+        )
 
-    def get_embedding_model(self):
-        return self.embeddings
+    def perform_rag_search(self, store: VectorStore, query: str, k: int = 3,
+                           filters: Optional[SearchFilter] = None) -> str:
+        return "".join(self.stream_rag_search(store, query, k, filters)).strip()
 
-    def perform_rag_search(self, store: VectorStore, query: str, k: int = 3) -> str:
+    def stream_rag_search(self, store: VectorStore, query: str, k: int = 3,
+                          filters: Optional[SearchFilter] = None) -> Iterator[str]:
         try:
             logging.info("Performing RAG search.")
-            results = store.search(query, k)
+            results = store.search(query, k, filters=filters)
+            texts = store.get_texts([result['id'] for result in results])
 
-            context = "\n\n".join([f"{result['title']}: {result['summary']}\nTopics: {result['topics']}\nURL: {result['url']}" for i, result in enumerate(results)])
+            context = self.context_builder.build(results, texts)
 
             prompt = f"""
                     Based on the following news, please choose the one that best answers the query below.
@@ -98,19 +255,11 @@ class GenAIAnalyzer(Analyzer):
                     Answer: 
                     """
 
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=300
-            )
-            answer_text = completion.choices[0].message.content.strip()
+            yield from self._stream("llm_rag", prompt)
             logging.info("Received response from GenAI.")
         except Exception as e:
             logging.error("Unexpected error: %s", e)
-            return f"Unexpected RAG error: {e}"
-
-        return answer_text
+            yield f"Unexpected RAG error: {e}"
 
     def augment_query_with_history(self, history_queries, original_query):
         logging.info("Augmenting query with history: original_query='%s', history_count=%d",
@@ -121,21 +270,24 @@ class GenAIAnalyzer(Analyzer):
                 logging.info("No history queries provided. Returning original query.")
                 return original_query
 
+            if self.analysis_cache is not None:
+                cached = self.analysis_cache.get_augmentation(self.model, AUGMENT_PROMPT_VERSION, history_queries,
+                                                              original_query)
+                if cached is not None:
+                    logging.info("Augmented query found in cache: '%s'", cached)
+                    return cached
+
             history_str = " ".join(history_queries)
             logging.info("History string for augmentation: '%s'", history_str)
 
             prompt = f"Enhance the query '{original_query}' based on history: {history_str}. Make it more contextual and send only the enhanced query"
             logging.info("Sending prompt: '%s'", prompt)
 
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=300
-            )
-
-            augmented = response.choices[0].message.content.strip()
+            augmented = self._complete("llm_augment", prompt)
             logging.info("Augmented query received: '%s'", augmented)
+            if self.analysis_cache is not None and augmented:
+                self.analysis_cache.put_augmentation(self.model, AUGMENT_PROMPT_VERSION, history_queries,
+                                                     original_query, augmented)
 
             return augmented
 
@@ -0,0 +1,91 @@
+import threading
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utils.text_utils import tokenize
+
+HASH_FEATURES = 2 ** 14
+
+
+@lru_cache(maxsize=500000)
+def _hash(term: str) -> int:
+    return zlib.crc32(term.encode("utf-8"))
+
+
+class HashedEmbeddings(Embeddings):
+    def __init__(self, dimensions: int = 384, features: int = HASH_FEATURES, seed: int = 0, batch_size: int = 256,
+                 workers: int = 1):
+        self.dimensions = dimensions
+        self.features = features
+        self.seed = seed
+        self.batch_size = batch_size
+        self.workers = workers
+        self.model = f"hashed-tf-{features}-{seed}"
+        # A seeded Gaussian random projection, identical in every process and
+        # on every run, so vectors from different builds stay comparable.
+        rng = np.random.default_rng(seed)
+        self._projection = rng.standard_normal((features, dimensions), dtype=np.float32) / np.sqrt(dimensions)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def settings(self) -> dict:
+        return {"dimensions": self.dimensions, "features": self.features, "seed": self.seed}
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        tokens = tokenize(text)
+        terms = Counter(tokens)
+        terms.update(map(" ".join, zip(tokens, tokens[1:])))
+        if not terms:
+            return np.zeros(self.dimensions, dtype=np.float32)
+        hashes = np.fromiter(map(_hash, terms), dtype=np.uint32, count=len(terms))
+        # Sublinear term frequency, so a word repeated through a long article
+        # does not drown out the rest. The top hash bit picks a sign so that
+        # colliding terms tend to cancel out instead of piling up in one bucket.
+        weights = np.log1p(np.fromiter(terms.values(), dtype=np.float32, count=len(terms)))
+        weights[hashes >> 31 == 1] *= -1
+        buckets, inverse = np.unique(hashes % self.features, return_inverse=True)
+        return np.bincount(inverse, weights=weights).astype(np.float32) @ self._projection[buckets]
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        vectors = np.stack([self._embed_one(text) for text in texts])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        if self.workers > 1 and len(batches) > 1:
+            vectors = list(self._get_pool().map(_embed_in_worker, [self.settings] * len(batches), batches))
+        else:
+            vectors = [self.embed_batch(batch) for batch in batches]
+        return np.vstack(vectors).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_batch([text])[0].tolist()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+
+_worker_embeddings = None
+
+
+def _embed_in_worker(settings: dict, texts: List[str]) -> np.ndarray:
+    # Each worker process builds the projection once and reuses it for every batch.
+    global _worker_embeddings
+    if _worker_embeddings is None or _worker_embeddings.settings != settings:
+        _worker_embeddings = HashedEmbeddings(**settings)
+    return _worker_embeddings.embed_batch(texts)
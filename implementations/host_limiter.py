@@ -0,0 +1,27 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+from utils.text_utils import url_domain
+
+
+class HostLimiter:
+    # Caps the requests in flight to any one host, however many workers
+    # share the limiter; 0 leaves them unlimited.
+    def __init__(self, per_host: int = 2):
+        self.per_host = per_host
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def limit(self, url: str):
+        if self.per_host <= 0:
+            yield
+            return
+        host = url_domain(url)
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+        with semaphore:
+            yield
@@ -1,39 +1,130 @@
-from interfaces.extractor import Extractor
+import codecs
+import re
+from typing import Optional
+
+from interfaces.extractor import Extractor, FetchResult
+from implementations.fetch_cache import FetchCache
+from implementations.host_limiter import HostLimiter
+from utils.metrics import METRICS
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, Tag
 import logging
 
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_.:-]+)""", re.IGNORECASE)
+
 class HTMLContentExtractor(Extractor):
+    def __init__(self, pool_size: int = 10, timeout: float = 30, cache: Optional[FetchCache] = None,
+                 cache_only: bool = False, per_host: int = 0):
+        self.timeout = timeout
+        self.cache = cache
+        self.cache_only = cache_only
+        self.hosts = HostLimiter(per_host)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(self, url: str) -> FetchResult:
+        cached = self.cache.get(url) if self.cache is not None else None
+        if self.cache_only:
+            if cached is None:
+                METRICS.inc("cache_misses_total", cache="fetch")
+                raise LookupError(f"{url} is not in the fetch cache")
+            METRICS.inc("cache_hits_total", cache="fetch")
+            return FetchResult(cached["body"], not_modified=True)
+
+        headers = {}
+        if cached is not None:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        with self.hosts.limit(url):
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached is not None:
+            logging.info(f"{url} not modified since last fetch, using cached copy")
+            METRICS.inc("cache_hits_total", cache="fetch")
+            return FetchResult(cached["body"], not_modified=True)
+        response.raise_for_status()
+        METRICS.inc("cache_misses_total", cache="fetch")
+        METRICS.inc("fetched_bytes_total", len(response.content))
+        response.encoding = self._detect_encoding(response)
+
+        if self.cache is not None:
+            self.cache.put(url, response.text, response.headers.get("ETag"),
+                           response.headers.get("Last-Modified"))
+        return FetchResult(response.text)
+
+    @staticmethod
+    def _detect_encoding(response: requests.Response) -> str:
+        if 'charset=' in response.headers.get('Content-Type', '').lower() and response.encoding:
+            return response.encoding
+
+        match = META_CHARSET.search(response.content[:4096])
+        if match:
+            declared = match.group(1).decode('ascii', errors='ignore')
+            try:
+                codecs.lookup(declared)
+                return declared
+            except LookupError:
+                logging.warning(f"Unknown charset {declared} declared by {response.url}")
+
+        # Charset detection scans the whole body, so it is only the last resort.
+        return response.apparent_encoding
+
+    @staticmethod
+    def parse(html: str) -> tuple[str, str]:
+        soup = BeautifulSoup(html, HTML_PARSER)
+
+        title_tag = soup.find('h1')
+        if not title_tag:
+            title_tag = soup.find('title')
+        title = title_tag.get_text(strip=True) if title_tag else "No title"
+
+        article = soup.find('article')
+        if article:
+            paragraphs = article.find_all('p')
+        else:
+            best_div = HTMLContentExtractor._densest_div(soup)
+            paragraphs = best_div.find_all('p') if best_div else []
+
+        text = "\n".join(p.get_text(strip=True) for p in paragraphs)
+
+        return title, text
+
+    @staticmethod
+    def _densest_div(soup: BeautifulSoup) -> Optional[Tag]:
+        elements = [node for node in soup.descendants if isinstance(node, Tag)]
+
+        # Walking the document in reverse order visits children before their
+        # parents, so each element's paragraph count is final when it is
+        # reached and only has to be pushed up to its parent once.
+        p_counts = {}
+        for element in reversed(elements):
+            count = p_counts.get(id(element), 0) + (element.name == 'p')
+            p_counts[id(element)] = count
+            if element.parent is not None:
+                p_counts[id(element.parent)] = p_counts.get(id(element.parent), 0) + count
+
+        max_p_count = 0
+        best_div = None
+        for element in elements:
+            if element.name == 'div' and p_counts[id(element)] > max_p_count:
+                max_p_count = p_counts[id(element)]
+                best_div = element
+        return best_div
+
     def extract(self, url: str) -> tuple[str, str]:
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            response.encoding = response.apparent_encoding
-
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            title_tag = soup.find('h1')
-            if not title_tag:
-                title_tag = soup.find('title')
-            title = title_tag.get_text(strip=True) if title_tag else "No title"
-
-            article = soup.find('article')
-            if article:
-                paragraphs = article.find_all('p')
-            else:
-                divs = soup.find_all('div')
-                max_p_count = 0
-                best_div = None
-                for div in divs:
-                    p_count = len(div.find_all('p'))
-                    if p_count > max_p_count:
-                        max_p_count = p_count
-                        best_div = div
-                paragraphs = best_div.find_all('p') if best_div else []
-
-            text = "\n".join(p.get_text(strip=True) for p in paragraphs)
-
-            return title, text
+            return self.parse(self.fetch(url).html)
 
         except requests.exceptions.RequestException as req_error:
 
@@ -45,4 +136,4 @@ class HTMLContentExtractor(Extractor):
 
             logging.exception(f"Error occurred while extracting content from URL {url}: {str(e)}")
 
-            return "", ""
\ No newline at end of file
+            return "", ""
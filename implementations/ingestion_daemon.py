@@ -0,0 +1,261 @@
+import datetime
+import email.utils
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from interfaces.store import VectorStore
+from implementations.feed_parser import Feed, FeedEntry, parse_feed
+from implementations.frontier import Frontier
+from implementations.host_limiter import HostLimiter
+from implementations.ingestion_pipeline import IngestionPipeline
+from utils.metrics import METRICS
+from utils.text_utils import clean_url, url_domain
+
+DEFAULT_POLL_MINUTES = 15
+MAX_BACKOFF = 6 * 3600
+# Only the most recently modified child sitemaps of a sitemap index are read;
+# older ones list articles that were discovered on earlier polls.
+SITEMAP_CHILDREN = 5
+# Longest the loop sleeps, so a changed schedule or a stop request is
+# noticed without much delay.
+MAX_IDLE = 60
+
+
+def load_sources(path: str, default_minutes: float = DEFAULT_POLL_MINUTES) -> Dict[str, float]:
+    # One feed or sitemap URL per line, optionally followed by its polling
+    # interval in minutes. Returns the interval of each source in seconds.
+    sources = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            for number, line in enumerate(file, 1):
+                fields = line.split("#", 1)[0].split()
+                if not fields:
+                    continue
+                url = clean_url(fields[0])
+                try:
+                    minutes = float(fields[1]) if len(fields) > 1 else default_minutes
+                except ValueError:
+                    logging.warning(f"Invalid interval on line {number} of {path}, using {default_minutes} minutes")
+                    minutes = default_minutes
+                if not url.lower().startswith(("http://", "https://")) or minutes <= 0:
+                    logging.warning(f"Skipping line {number} of {path}: {line.strip()}")
+                    continue
+                sources[url] = minutes * 60
+    except FileNotFoundError:
+        logging.error(f"File not found: {path}")
+        return {}
+    logging.info(f"Loaded {len(sources)} feeds from {path}")
+    return sources
+
+
+def retry_after(response: requests.Response) -> float:
+    value = response.headers.get("Retry-After", "")
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def interleave_hosts(urls: List[str], limit: int) -> List[str]:
+    # Round-robin over sites so one busy feed does not fill a batch with
+    # pages that would all wait on the same per-host limit.
+    by_host = OrderedDict()
+    for url in urls:
+        by_host.setdefault(url_domain(url), []).append(url)
+    batch = []
+    while by_host and len(batch) < limit:
+        for host in list(by_host):
+            batch.append(by_host[host].pop(0))
+            if not by_host[host]:
+                del by_host[host]
+            if len(batch) >= limit:
+                break
+    return batch
+
+
+class IngestionDaemon:
+    def __init__(self, store: VectorStore, pipeline: IngestionPipeline, frontier: Frontier,
+                 sources: Dict[str, float], poll_workers: int = 4, hosts: Optional[HostLimiter] = None,
+                 batch_size: int = 32, batch_wait: float = 30, jitter: float = 0.2, max_attempts: int = 3,
+                 retry_delay: float = 300, max_age_days: float = 0, timeout: float = 30):
+        self.store = store
+        self.pipeline = pipeline
+        self.frontier = frontier
+        self.hosts = hosts or HostLimiter(0)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.max_age_days = max_age_days
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=poll_workers, pool_maxsize=poll_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, poll_workers), thread_name_prefix="poll")
+        self.frontier.sync_sources(sources, self.jitter)
+        # Pages indexed before the daemon started, e.g. by main.py, are
+        # skipped when a feed lists them again.
+        self.pipeline.known_ids = set(store.list_ids())
+
+    def _jittered(self, seconds: float) -> float:
+        # Sources sharing an interval drift apart instead of polling in lockstep.
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _get(self, url: str, headers: Optional[dict] = None) -> requests.Response:
+        with self.hosts.limit(url):
+            return self.session.get(url, headers=headers or {}, timeout=self.timeout)
+
+    def poll(self, source: Dict) -> int:
+        url = source["url"]
+        headers = {}
+        if source["etag"]:
+            headers["If-None-Match"] = source["etag"]
+        if source["last_modified"]:
+            headers["If-Modified-Since"] = source["last_modified"]
+        try:
+            with METRICS.stage("feed_poll", url=url):
+                response = self._get(url, headers)
+                if response.status_code == 304:
+                    METRICS.inc("feed_polls_total", status="not_modified")
+                    self.frontier.schedule(url, time.time() + self._jittered(source["interval"]),
+                                           etag=source["etag"], last_modified=source["last_modified"])
+                    logging.info(f"{url} not modified since last poll")
+                    return 0
+                if response.status_code >= 400:
+                    self._back_off(source, f"HTTP {response.status_code}", retry_after(response))
+                    return 0
+                added = self.frontier.discover([entry.url for entry in self._entries(response)], url)
+        except Exception as e:
+            self._back_off(source, str(e))
+            return 0
+
+        METRICS.inc("feed_polls_total", status="ok")
+        METRICS.inc("frontier_urls_total", added, state="discovered")
+        self.frontier.schedule(url, time.time() + self._jittered(source["interval"]),
+                               etag=response.headers.get("ETag"),
+                               last_modified=response.headers.get("Last-Modified"))
+        logging.info(f"Polled {url}: {added} new articles")
+        return added
+
+    def _entries(self, response: requests.Response) -> List[FeedEntry]:
+        feed = parse_feed(response.content, response.url)
+        entries = list(feed.entries)
+        if feed.sitemaps:
+            newest = sorted(feed.sitemaps, key=lambda entry: entry.published.timestamp() if entry.published else 0,
+                            reverse=True)[:SITEMAP_CHILDREN]
+            for sitemap in newest:
+                child = self._get(sitemap.url)
+                child.raise_for_status()
+                entries.extend(parse_feed(child.content, child.url).entries)
+        return self._recent(feed, entries)
+
+    def _recent(self, feed: Feed, entries: List[FeedEntry]) -> List[FeedEntry]:
+        if not self.max_age_days:
+            return entries
+        oldest = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=self.max_age_days)
+        recent = [entry for entry in entries if entry.published is None or entry.published >= oldest]
+        if len(recent) < len(entries):
+            logging.info(f"Skipped {len(entries) - len(recent)} {feed.kind} entries older than "
+                         f"{self.max_age_days} days")
+        return recent
+
+    def _back_off(self, source: Dict, reason: str, wait: float = 0) -> None:
+        # Failing sources are polled exponentially less often, but never less
+        # than every MAX_BACKOFF seconds nor sooner than the server asked.
+        failures = source["failures"] + 1
+        delay = max(wait, self._jittered(min(MAX_BACKOFF, source["interval"] * 2 ** failures)))
+        METRICS.inc("feed_polls_total", status="error")
+        self.frontier.schedule(source["url"], time.time() + delay, failures=failures)
+        logging.error(f"Error polling {source['url']} ({reason}), retrying in {delay / 60:.1f} minutes")
+
+    def poll_due(self, now: Optional[float] = None) -> int:
+        due = self.frontier.due_sources(now)
+        if not due:
+            return 0
+        return sum(self._pool.map(self.poll, due))
+
+    def ingest_batch(self, force: bool = False) -> int:
+        # Pages are ingested in micro-batches: as soon as a batch is full, or
+        # once its oldest page has waited batch_wait seconds.
+        pending = self.frontier.pending(self.batch_size * 4)
+        if not pending:
+            return 0
+        if not force and len(pending) < self.batch_size and time.time() - pending[0][1] < self.batch_wait:
+            return 0
+        urls = interleave_hosts([url for url, _ in pending], self.batch_size)
+
+        with METRICS.stage("micro_batch", urls=len(urls)):
+            try:
+                documents = self.pipeline.run(urls)
+                self.store.upsert(documents)
+            except Exception as e:
+                logging.error(f"Error ingesting a batch of {len(urls)} URLs: {str(e)}")
+                if self.pipeline.duplicates is not None:
+                    # Nothing of the batch was indexed, so its pages must not
+                    # keep their copies out when they are retried.
+                    for url in urls:
+                        self.pipeline.duplicates.remove(url)
+                self._failed(urls)
+                return len(urls)
+
+        self.pipeline.known_ids.update(doc.id for doc in documents)
+        failed = [url for url in urls if url in self.pipeline.failed]
+        self._failed(failed)
+        done = [url for url in urls if url not in self.pipeline.failed]
+        self.frontier.mark_done(done)
+        METRICS.inc("frontier_urls_total", len(done), state="done")
+        logging.info(f"Micro-batch indexed {len(documents)} of {len(urls)} URLs, {len(failed)} failed, "
+                     f"{len(self.pipeline.aliases)} duplicates")
+        return len(urls)
+
+    def _failed(self, urls: List[str]) -> None:
+        if not urls:
+            return
+        given_up = self.frontier.mark_failed(urls, self.retry_delay, self.max_attempts)
+        METRICS.inc("frontier_urls_total", len(urls) - given_up, state="retry")
+        METRICS.inc("frontier_urls_total", given_up, state="failed")
+        if given_up:
+            logging.warning(f"Gave up on {given_up} URLs after {self.max_attempts} attempts")
+
+    def run_once(self) -> None:
+        # Polls every source now, whatever its schedule, and ingests all that
+        # is pending.
+        self.poll_due(float("inf"))
+        while self.ingest_batch(force=True):
+            pass
+
+    def run(self, stop: threading.Event) -> None:
+        logging.info("Ingestion daemon started: %s", self.frontier.stats())
+        while not stop.is_set():
+            self.poll_due()
+            while not stop.is_set() and self.ingest_batch():
+                pass
+            stop.wait(self._idle_time())
+        logging.info("Ingestion daemon stopped: %s", self.frontier.stats())
+
+    def _idle_time(self) -> float:
+        now = time.time()
+        wake = [now + MAX_IDLE]
+        for moment in (self.frontier.next_poll(), self.frontier.next_attempt(now)):
+            if moment is not None:
+                wake.append(moment)
+        pending = self.frontier.pending(1)
+        if pending:
+            wake.append(pending[0][1] + self.batch_wait)
+        return max(0.0, min(wake) - now)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        self.session.close()
@@ -0,0 +1,195 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from langchain_core.documents import Document
+
+from interfaces.analyzer import Analyzer
+from implementations.analysis_scheduler import AnalysisScheduler
+from interfaces.document_creator import DocumentCreator
+from interfaces.extractor import Extractor
+from implementations.duplicate_index import DuplicateIndex
+from implementations.fetch_cache import FetchCache
+from utils.metrics import METRICS
+from utils.text_utils import document_id, normalize_url
+
+_DONE = object()
+
+
+class IngestionPipeline:
+    def __init__(self, extractor: Extractor, analyzer: Union[Analyzer, AnalysisScheduler], document_creator: DocumentCreator,
+                 fetch_workers: int = 8, parse_workers: int = 2, analyze_workers: int = 4,
+                 queue_size: int = 32, fetch_cache: Optional[FetchCache] = None,
+                 known_ids: Optional[Set[str]] = None, duplicates: Optional[DuplicateIndex] = None):
+        self.extractor = extractor
+        self.analyzer = analyzer
+        self.document_creator = document_creator
+        self.fetch_workers = max(1, fetch_workers)
+        self.parse_workers = max(1, parse_workers)
+        self.analyze_workers = max(1, analyze_workers)
+        self.queue_size = queue_size
+        self.fetch_cache = fetch_cache
+        self.known_ids = known_ids or set()
+        self.duplicates = duplicates
+        # URL -> canonical URL for pages skipped as copies during the last run.
+        self.aliases: Dict[str, str] = {}
+        # URL -> stage for pages that failed during the last run.
+        self.failed: Dict[str, str] = {}
+
+    def run(self, urls: Iterable[str]) -> List[Document]:
+        documents = sorted(self._run(urls), key=lambda item: item[0])
+        return [document for _, document in documents]
+
+    def stream(self, urls: Iterable[str]) -> Iterator[Document]:
+        for _, document in self._run(urls):
+            yield document
+
+    def _run(self, urls: Iterable[str]) -> Iterator[Tuple[int, Document]]:
+        results = queue.Queue(maxsize=self.queue_size)
+        runner = threading.Thread(target=self._run_stages, args=(urls, results), name="ingestion", daemon=True)
+        runner.start()
+        count = 0
+        while True:
+            item = results.get()
+            if item is _DONE:
+                break
+            count += 1
+            yield item
+        runner.join()
+        logging.info(f"Ingestion pipeline created {count} documents")
+
+    def _run_stages(self, urls: Iterable[str], results: queue.Queue) -> None:
+        url_queue = queue.Queue(maxsize=self.queue_size)
+        fetched = queue.Queue(maxsize=self.queue_size)
+        parsed = queue.Queue(maxsize=self.queue_size)
+        self.aliases = {}
+        self.failed = {}
+
+        # Queues are bounded so a slow stage blocks the stages feeding it
+        # instead of letting fetched pages pile up in memory.
+        try:
+            with ProcessPoolExecutor(max_workers=self.parse_workers) as parse_pool:
+                stages = [
+                    (self._start_stage("fetch", self.fetch_workers, url_queue, fetched,
+                                       lambda item: self._fetch(item, results)), fetched,
+                     self.parse_workers),
+                    (self._start_stage("parse", self.parse_workers, fetched, parsed,
+                                       lambda item: self._parse(parse_pool, item)), parsed, self.analyze_workers),
+                    (self._start_stage("analyze", self.analyze_workers, parsed, None,
+                                       lambda item: self._analyze(item, results)), None, 0),
+                ]
+
+                seen = set()
+                for position, url in enumerate(urls):
+                    normalized = normalize_url(url)
+                    if normalized in seen:
+                        logging.info(f"Skipping duplicate URL {url}")
+                        continue
+                    seen.add(normalized)
+                    url_queue.put((position, url))
+                for _ in range(self.fetch_workers):
+                    url_queue.put(_DONE)
+
+                for workers, downstream, downstream_workers in stages:
+                    for worker in workers:
+                        worker.join()
+                    for _ in range(downstream_workers):
+                        downstream.put(_DONE)
+
+            logging.info(f"Ingestion pipeline processed {len(seen)} URLs, {len(self.aliases)} duplicates skipped")
+        finally:
+            results.put(_DONE)
+
+    def _start_stage(self, name: str, workers: int, inbox: queue.Queue, outbox: Optional[queue.Queue],
+                     handler: Callable) -> List[threading.Thread]:
+        def work():
+            while True:
+                item = inbox.get()
+                if item is _DONE:
+                    return
+                try:
+                    with METRICS.stage(name, url=item[1]):
+                        result = handler(item)
+                except Exception as e:
+                    logging.error(f"Error in {name} stage for {item[1]}: {str(e)}")
+                    self._fail(item[1], name)
+                    continue
+                if result is not None and outbox is not None:
+                    outbox.put(result)
+
+        threads = [threading.Thread(target=work, name=f"{name}-{i}", daemon=True) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _fail(self, url: str, stage: str) -> None:
+        self.failed[url] = stage
+        if self.duplicates is not None:
+            # A page that is not indexed this time, e.g. because it no longer
+            # loads, stops being canonical so its copies get indexed instead.
+            self.duplicates.remove(url)
+
+    def _fetch(self, item, results: queue.Queue):
+        position, url = item
+        result = self.extractor.fetch(url)
+        if result.not_modified and self.fetch_cache is not None:
+            cached = self.fetch_cache.get_document(url)
+            if cached is not None:
+                # Unchanged pages are checked too, so the corpus indexed before
+                # deduplication was enabled is registered and its copies dropped.
+                if self.duplicates is not None and self._is_duplicate(url, cached["text"]):
+                    return None
+                if document_id(url, cached["title"], cached["text"]) in self.known_ids:
+                    logging.info(f"{url} is unchanged and already indexed")
+                    return None
+                document = self.document_creator.create_document(
+                    cached["title"], cached["summary"], cached["topics"], cached["text"], url)
+                results.put((position, document))
+                logging.info(f"Reused cached document for unchanged {url}")
+                return None
+        return position, url, result.html
+
+    def _parse(self, parse_pool: ProcessPoolExecutor, item):
+        position, url, html = item
+        title, text = parse_pool.submit(self.extractor.parse, html).result()
+        if not text or not title:
+            logging.warning(f"Failed to extract content from {url}: title={title}, text_length={len(text) if text else 0}")
+            METRICS.inc("stage_errors_total", stage="parse")
+            self._fail(url, "parse")
+            return None
+        # Checked before the known ids, so a copy indexed before it was
+        # recognised as one is still reported and can be dropped.
+        if self.duplicates is not None and self._is_duplicate(url, text):
+            return None
+        if document_id(url, title, text) in self.known_ids:
+            logging.info(f"{url} is unchanged and already indexed")
+            return None
+        return position, url, title, text
+
+    def _is_duplicate(self, url: str, text: str) -> bool:
+        with METRICS.stage("dedup", url=url):
+            match = self.duplicates.check(url, text)
+        if match is None:
+            return False
+        canonical, similarity = match
+        self.aliases[url] = canonical
+        METRICS.inc("duplicates_total", kind="exact" if similarity >= 1 else "near")
+        logging.info(f"{url} is a copy of {canonical} (similarity {similarity:.2f}), skipping")
+        return True
+
+    def _analyze(self, item, results: queue.Queue):
+        position, url, title, text = item
+        summary, topics = self.analyzer.analyze(title, text)
+        if not summary or not topics:
+            logging.warning(f"Analysis failed for {url}: summary={summary}, topics={topics}")
+            METRICS.inc("stage_errors_total", stage="analyze")
+            self._fail(url, "analyze")
+            return None
+        document = self.document_creator.create_document(title, summary, topics, text, url)
+        results.put((position, document))
+        if self.fetch_cache is not None:
+            self.fetch_cache.put_document(url, {"title": title, "summary": summary, "topics": topics, "text": text})
+        logging.info(f"Document created for {url}: title={title}")
+        return None
@@ -0,0 +1,37 @@
+import importlib
+
+# Backends are referenced by import path so that only the selected one (and
+# its heavy dependencies such as chromadb or faiss) is ever imported.
+STORES = {
+    "FAISS": "implementations.stores.faiss_store:FAISSStore",
+    "Chroma": "implementations.stores.chroma_store:ChromaStore",
+}
+
+ANALYZERS = {
+    "genai": "implementations.genai_analyser:GenAIAnalyzer",
+}
+
+# Local embedding providers; "openai" is built by the analyzer itself.
+EMBEDDINGS = {
+    "hashed": "implementations.hashed_embeddings:HashedEmbeddings",
+    "local": "implementations.sentence_transformer_embeddings:SentenceTransformerEmbeddings",
+}
+
+
+def _load(registry: dict, name: str):
+    if name not in registry:
+        raise ValueError(f"Unknown backend {name!r}, expected one of {sorted(registry)}")
+    module_name, class_name = registry[name].split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def get_store_class(name: str):
+    return _load(STORES, name)
+
+
+def get_analyzer_class(name: str = "genai"):
+    return _load(ANALYZERS, name)
+
+
+def get_embeddings_class(name: str):
+    return _load(EMBEDDINGS, name)
@@ -0,0 +1,129 @@
+import datetime
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, List
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+HISTORY_MAX_BYTES = 1024 * 1024
+HISTORY_BACKUPS = 3
+TAIL_BLOCK_SIZE = 8192
+
+# Without fcntl only threads of this process are kept apart.
+_fallback_lock = threading.Lock()
+
+
+class SearchHistory:
+    def __init__(self, path: str = "search_history.jsonl", max_bytes: int = HISTORY_MAX_BYTES,
+                 backups: int = HISTORY_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._migrate()
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        # The lock lives in a separate file so that it survives rotation.
+        if fcntl is None:
+            with _fallback_lock:
+                yield
+            return
+        with open(f"{self.path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _migrate(self) -> None:
+        # Older versions rewrote the whole history as one JSON array, by
+        # default in search_history.json; it is converted into the new file
+        # and left in place.
+        source = self.path
+        if self.path.endswith(".jsonl") and not os.path.exists(self.path) and os.path.exists(self.path[:-1]):
+            source = self.path[:-1]
+        try:
+            with open(source, 'rb') as f:
+                if f.read(64).lstrip()[:1] != b"[":
+                    return
+        except FileNotFoundError:
+            return
+        with self._locked(exclusive=True):
+            if source != self.path and os.path.exists(self.path):
+                return
+            try:
+                with open(source, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (json.JSONDecodeError, ValueError):
+                return
+            temporary = f"{self.path}.tmp"
+            with open(temporary, 'w', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(temporary, self.path)
+        logging.info(f"Converted {len(entries)} history entries in {source} to JSON lines in {self.path}")
+
+    def append(self, query: str) -> None:
+        line = json.dumps({"timestamp": datetime.datetime.now().isoformat(), "query": query}, ensure_ascii=False)
+        with self._locked(exclusive=True):
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+                size = f.tell()
+            if size >= self.max_bytes:
+                self._rotate()
+
+    def _rotate(self) -> None:
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        for number in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{number}"):
+                os.replace(f"{self.path}.{number}", f"{self.path}.{number + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        logging.info(f"Rotated search history {self.path}")
+
+    def tail(self, count: int) -> List[Dict]:
+        if count <= 0:
+            return []
+        entries = []
+        with self._locked(exclusive=False):
+            for path in [self.path] + [f"{self.path}.{number}" for number in range(1, self.backups + 1)]:
+                if len(entries) >= count:
+                    break
+                entries = self._read_tail(path, count - len(entries)) + entries
+        return entries
+
+    @staticmethod
+    def _read_tail(path: str, count: int) -> List[Dict]:
+        # Reads backwards from the end only as far as the last entries go,
+        # however long the file has grown.
+        try:
+            with open(path, 'rb') as f:
+                position = f.seek(0, os.SEEK_END)
+                data = b""
+                while position > 0 and data.count(b"\n") <= count:
+                    step = min(TAIL_BLOCK_SIZE, position)
+                    position -= step
+                    f.seek(position)
+                    data = f.read(step) + data
+        except FileNotFoundError:
+            return []
+
+        lines = data.splitlines()
+        if position > 0:
+            lines = lines[1:]
+        entries = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                logging.warning(f"Skipping malformed history entry in {path}")
+        return entries[-count:]
@@ -0,0 +1,43 @@
+import logging
+import os
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    def __init__(self, model_path: str, batch_size: int = 64, workers: int = 1, dimensions: Optional[int] = None):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("Local model embeddings need the sentence-transformers package: "
+                              "pip install sentence-transformers") from e
+        if not model_path:
+            raise ValueError("Local model embeddings need --embedding_model_path")
+
+        self.batch_size = batch_size
+        self.workers = workers
+        self.model = os.path.basename(os.path.normpath(model_path))
+        self._model = SentenceTransformer(model_path, device="cpu", truncate_dim=dimensions)
+        self.dimensions = self._model.get_sentence_embedding_dimension()
+        logging.info(f"Loaded local embedding model {self.model} ({self.dimensions} dimensions)")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Worker processes each load their own copy of the model, which only
+        # pays off for builds large enough to keep them all busy.
+        if self.workers > 1 and len(texts) >= self.batch_size * self.workers:
+            pool = self._model.start_multi_process_pool(["cpu"] * self.workers)
+            try:
+                vectors = self._model.encode_multi_process(texts, pool, batch_size=self.batch_size,
+                                                           normalize_embeddings=True)
+            finally:
+                self._model.stop_multi_process_pool(pool)
+        else:
+            vectors = self._model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                         convert_to_numpy=True)
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._model.encode([text], normalize_embeddings=True, convert_to_numpy=True)[0].tolist()
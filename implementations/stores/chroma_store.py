@@ -1,23 +1,67 @@
+import json
 import logging
 import os
-from typing import List
-from uuid import uuid4
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Set
 
 import chromadb
 from langchain_core.documents import Document
 
-from interfaces.store import VectorStore
+from interfaces.store import SearchFilter, VectorStore
+from implementations.stores.lexical_index import HYBRID_CANDIDATES, LexicalIndex, reciprocal_rank_fusion
+from implementations.stores.metadata_store import MetadataStore
+from utils.metrics import METRICS
+from utils.text_utils import date_number, topic_key, url_date, url_domain
+
+RESULT_FIELDS = ("title", "summary", "topics", "url")
+TOPIC_PREFIX = "topic:"
 
 
 class ChromaStore(VectorStore):
-    def __init__(self, embedding_model, index_path="chroma_index"):
+    def __init__(self, embedding_model, index_path="chroma_index", batch_size=256, search_mode="vector"):
         self.index_path = index_path
         self.client = chromadb.Client()
         self.embedding_model = embedding_model
         self.client = chromadb.PersistentClient(path=self.index_path)
         self.client.heartbeat()
         self.collection = self.client.get_or_create_collection("collection")
+        self.batch_size = max(1, min(batch_size, self.client.get_max_batch_size()))
+        self.checkpoint_path = os.path.join(self.index_path, "build_checkpoint.json")
+        # Full article text is kept out of the collection and only read for RAG.
+        self.texts = MetadataStore(os.path.join(self.index_path, "texts.db"))
+        self.lexical = LexicalIndex(os.path.join(self.index_path, "lexical.db"))
+        self.search_mode = search_mode
         logging.info(f"Initial collection count after init: {self.collection.count()}")
+        if self.collection.count() and not self.lexical.count():
+            self._backfill_lexical()
+        if self.collection.count():
+            sample = self.collection.get(limit=1, include=["metadatas"])["metadatas"][0]
+            if "domain" not in sample:
+                self._backfill_filters()
+
+    def _backfill_lexical(self) -> None:
+        # Collections built before the lexical index existed get one from their metadata.
+        logging.info("Building lexical index from existing collection...")
+        results = self.collection.get(include=["metadatas"])
+        texts = self.texts.get_texts(results["ids"])
+        self.lexical.add([
+            Document(id=doc_id, page_content="",
+                     metadata={**metadata, "topics": metadata.get("topics", "").split(", "),
+                               "text": texts.get(doc_id, "")})
+            for doc_id, metadata in zip(results["ids"], results["metadatas"])
+        ])
+
+    def _backfill_filters(self) -> None:
+        # Collections built before search filters existed get their filter keys from their metadata.
+        logging.info("Adding search filter keys to existing collection...")
+        results = self.collection.get(include=["metadatas"])
+        for start in range(0, len(results["ids"]), self.batch_size):
+            ids = results["ids"][start:start + self.batch_size]
+            self.collection.update(ids=ids, metadatas=[
+                self._metadata(Document(id=doc_id, page_content="",
+                                        metadata={**metadata, "topics": metadata.get("topics", "").split(", ")}))
+                for doc_id, metadata in zip(ids, results["metadatas"][start:start + self.batch_size])
+            ])
 
     def index_exists(self) -> bool:
         if not os.path.exists(self.index_path):
@@ -29,6 +73,10 @@ class ChromaStore(VectorStore):
             logging.warning("Collection 'collection' not found in list_collections().")
             return False
 
+        if os.path.exists(self.checkpoint_path):
+            logging.warning("A previous Chroma build did not finish, it will be resumed.")
+            return False
+
         count = self.collection.count()
         if count == 0:
             logging.warning(
@@ -38,45 +86,234 @@ class ChromaStore(VectorStore):
         logging.info(f"Index exists with {count} documents.")
         return True
 
-    def build_index(self, documents: List[Document]) -> None:
+    def build_index(self, documents: Iterable[Document]) -> None:
         try:
-            logging.info("Building Chroma index...")
-
-            collections = [col.name for col in self.client.list_collections()]
-            if "collection" in collections:
-                logging.info("Deleting existing collection 'collection' before rebuild.")
-                self.client.delete_collection("collection")
-                self.collection = self.client.get_or_create_collection("collection")
-
-            embeddings = self.embedding_model.embed_documents([doc.page_content for doc in documents])
-            texts = [doc.page_content for doc in documents]
-            metadatas = [{"title": doc.metadata["title"], "topics": ", ".join(doc.metadata["topics"]),
-                          "summary": doc.metadata["summary"], "url": doc.metadata["url"]} for doc in documents]
-            ids = [str(uuid4()) for _ in documents]
-
-            self.collection.add(
-                ids=ids,
-                documents=texts,
-                metadatas=metadatas,
-                embeddings=embeddings
-            )
+            written = self._read_checkpoint()
+            if written is None:
+                logging.info("Building Chroma index...")
+                collections = [col.name for col in self.client.list_collections()]
+                if "collection" in collections:
+                    logging.info("Deleting existing collection 'collection' before rebuild.")
+                    self.client.delete_collection("collection")
+                    self.collection = self.client.get_or_create_collection("collection")
+                    self.texts.clear()
+                    self.lexical.clear()
+                written = 0
+                self._write_checkpoint(written)
+                resuming = False
+            else:
+                logging.info(f"Resuming Chroma build after {written} documents.")
+                resuming = True
+
+            # Documents are embedded and written one batch at a time, so memory
+            # stays bounded by batch_size however long the input stream is.
+            for batch in self._batches(documents):
+                if resuming:
+                    present = set(self.collection.get(ids=[doc.id for doc in batch], include=[])["ids"])
+                    batch = [doc for doc in batch if doc.id not in present]
+                    if not batch:
+                        continue
+                self.texts.put_texts({doc.id: doc.metadata.get("text", "") for doc in batch})
+                self.lexical.add(batch)
+                records = self._records(batch)
+                with METRICS.stage("index_write", documents=len(batch)):
+                    self.collection.add(**records)
+                written += len(batch)
+                self._write_checkpoint(written)
+                logging.info(f"Wrote {written} documents to Chroma collection.")
+
+            os.remove(self.checkpoint_path)
             self.client.heartbeat()
 
-            logging.info("Chroma index successfully built.")
+            logging.info(f"Chroma index successfully built with {self.collection.count()} documents.")
         except Exception as e:
             logging.error(f"Error building Chroma index: {str(e)}")
+            raise
+
+    def _batches(self, documents: Iterable[Document]) -> Iterator[List[Document]]:
+        documents = iter(documents)
+        while True:
+            batch = list(islice(documents, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def _read_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                return json.load(f)["written"]
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable build checkpoint: {str(e)}")
+            return 0
+
+    def _write_checkpoint(self, written: int) -> None:
+        # Written to a temporary file first so a crash never leaves a torn checkpoint.
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"written": written}, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def upsert(self, documents: List[Document]) -> None:
+        if not documents:
+            return
+        try:
+            # Batched like builds, so large updates stay under Chroma's max batch size.
+            for batch in self._batches(documents):
+                records = self._records(batch)
+                with METRICS.stage("index_write", documents=len(batch)):
+                    self.collection.upsert(**records)
+                self.texts.put_texts({doc.id: doc.metadata.get("text", "") for doc in batch})
+                self.lexical.add(batch)
+            logging.info(f"Upserted {len(documents)} documents into Chroma collection.")
+        except Exception as e:
+            logging.error(f"Error upserting into Chroma collection: {str(e)}")
+            raise
+
+    def delete(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        try:
+            self.collection.delete(ids=ids)
+            self.texts.delete(ids)
+            self.lexical.delete(ids)
+            logging.info(f"Deleted {len(ids)} documents from Chroma collection.")
+        except Exception as e:
+            logging.error(f"Error deleting from Chroma collection: {str(e)}")
+            raise
+
+    def list_ids(self) -> List[str]:
+        return self.collection.get(include=[])["ids"]
+
+    def get_texts(self, ids: List[str]) -> dict:
+        return self.texts.get_texts(ids)
+
+    @staticmethod
+    def _result(doc_id: str, metadata: dict) -> dict:
+        return {"id": doc_id, **{field: metadata.get(field, "") for field in RESULT_FIELDS}}
+
+    @classmethod
+    def _with_ids(cls, results: dict) -> List[List[dict]]:
+        # Distances are negated into scores, so higher is better as for the
+        # lexical ranking and results from several collections can be merged.
+        return [
+            [{**cls._result(doc_id, metadata), "score": -distance}
+             for doc_id, metadata, distance in zip(ids, metadatas, distances)]
+            for ids, metadatas, distances in zip(results["ids"], results["metadatas"], results["distances"])
+        ]
+
+    @staticmethod
+    def _metadata(doc: Document) -> dict:
+        # Besides the fields returned with results, every document carries its
+        # domain, its URL date as a yyyymmdd number and one boolean key per
+        # topic, which Chroma indexes and search filters select on.
+        url = doc.metadata["url"]
+        metadata = {"title": doc.metadata["title"], "topics": ", ".join(doc.metadata["topics"]),
+                    "summary": doc.metadata["summary"], "url": url, "domain": url_domain(url)}
+        published = date_number(url_date(url))
+        if published:
+            metadata["published"] = published
+        metadata.update({f"{TOPIC_PREFIX}{topic_key(topic)}": True
+                         for topic in doc.metadata["topics"] if topic.strip()})
+        return metadata
+
+    @staticmethod
+    def _where(filters: Optional[SearchFilter]) -> Optional[dict]:
+        if not filters:
+            return None
+        conditions = []
+        if filters.topics:
+            topics = [{f"{TOPIC_PREFIX}{topic}": True} for topic in filters.topics]
+            conditions.append(topics[0] if len(topics) == 1 else {"$or": topics})
+        if filters.domains:
+            conditions.append({"domain": {"$in": list(filters.domains)}})
+        if filters.published_after:
+            conditions.append({"published": {"$gte": date_number(filters.published_after)}})
+        if filters.published_before:
+            conditions.append({"published": {"$lte": date_number(filters.published_before)}})
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def _allowed(self, where: Optional[dict]) -> Optional[Set[str]]:
+        if where is None:
+            return None
+        return set(self.collection.get(where=where, include=[])["ids"])
 
-    def search(self, query: str, k: int = 3) -> List[dict]:
+    def _records(self, documents: List[Document]) -> dict:
+        texts = [doc.page_content for doc in documents]
+        return {
+            "ids": [doc.id for doc in documents],
+            "documents": texts,
+            "metadatas": [self._metadata(doc) for doc in documents],
+            "embeddings": self._embed(texts),
+        }
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        with METRICS.stage("embed", documents=len(texts)):
+            return self.embedding_model.embed_documents(texts)
+
+    def search(self, query: str, k: int = 3, mode: Optional[str] = None,
+               filters: Optional[SearchFilter] = None) -> List[dict]:
+        mode = mode or self.search_mode
         try:
-            query_embedding = self.embedding_model.embed_query(query)
+            with METRICS.stage("search", query=query, mode=mode, filtered=bool(filters)):
+                where = self._where(filters)
+                if mode == "lexical":
+                    return self._lexical_search(query, k, self._allowed(where))
+                candidates = k * HYBRID_CANDIDATES if mode == "hybrid" else k
+                with METRICS.stage("embed", queries=1):
+                    query_embedding = self.embedding_model.embed_query(query)
 
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=k
-            )
+                results = self.collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=candidates,
+                    where=where,
+                    include=["metadatas", "distances"]
+                )
 
-            return results["metadatas"][0]
+                results = self._with_ids(results)[0]
+                if mode == "hybrid":
+                    results = reciprocal_rank_fusion(
+                        [results, self._lexical_search(query, candidates, self._allowed(where))], k)
+                return results
         except Exception as e:
             logging.error(f"Error during search: {str(e)}")
             return []
 
+    def search_many(self, queries: List[str], k: int = 3, mode: Optional[str] = None,
+                    filters: Optional[SearchFilter] = None) -> List[List[dict]]:
+        mode = mode or self.search_mode
+        if mode == "lexical":
+            return [self.search(query, k, mode, filters) for query in queries]
+        try:
+            with METRICS.stage("search", queries=len(queries), mode=mode, filtered=bool(filters)):
+                where = self._where(filters)
+                candidates = k * HYBRID_CANDIDATES if mode == "hybrid" else k
+                with METRICS.stage("embed", queries=len(queries)):
+                    query_embeddings = self.embedding_model.embed_documents(queries)
+
+                results = self.collection.query(
+                    query_embeddings=query_embeddings,
+                    n_results=candidates,
+                    where=where,
+                    include=["metadatas", "distances"]
+                )
+
+                results = self._with_ids(results)
+                if mode == "hybrid":
+                    allowed = self._allowed(where)
+                    results = [reciprocal_rank_fusion([found, self._lexical_search(query, candidates, allowed)], k)
+                               for query, found in zip(queries, results)]
+                return results
+        except Exception as e:
+            logging.error(f"Error during batch search: {str(e)}")
+            return [[] for _ in queries]
+
+    def _lexical_search(self, query: str, k: int, allowed: Optional[Set[str]] = None) -> List[dict]:
+        ranked = self.lexical.search(query, k, allowed)
+        if not ranked:
+            return []
+        results = self.collection.get(ids=[doc_id for doc_id, _ in ranked], include=["metadatas"])
+        found = {doc_id: self._result(doc_id, metadata)
+                 for doc_id, metadata in zip(results["ids"], results["metadatas"])}
+        return [{**found[doc_id], "score": score} for doc_id, score in ranked if doc_id in found]
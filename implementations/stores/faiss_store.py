@@ -1,70 +1,507 @@
 import faiss
+import math
 import os
 import logging
-from typing import List, Dict
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
 
-from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 
-from interfaces.store import VectorStore
+from interfaces.store import SearchFilter, VectorStore
+from implementations.stores.lexical_index import HYBRID_CANDIDATES, LexicalIndex, reciprocal_rank_fusion
+from implementations.stores.metadata_store import MetadataStore
+from utils.metrics import METRICS
+
+INDEX_TYPES = ("Flat", "HNSW", "IVFFlat", "IVFPQ")
+# Scalar quantizers store each dimension in 2 bytes or 1 byte instead of 4.
+SCALAR_QUANTIZERS = {"fp16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+COMPRESSIONS = ("none",) + tuple(SCALAR_QUANTIZERS)
+# Id selectors kept for the most recently used search filters.
+FILTER_CACHE_SIZE = 64
+
+
+def create_faiss_index(index_type: str, vectors: np.ndarray, nlist: int = 1024, pq_m: int = 64,
+                       hnsw_m: int = 32, train_sample: int = 100000, compression: str = "none",
+                       pca_dimensions: int = 0) -> faiss.Index:
+    count, dimension = vectors.shape
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown vector compression {compression!r}, expected one of {COMPRESSIONS}")
+    if pca_dimensions >= dimension:
+        logging.warning(f"PCA to {pca_dimensions} dimensions does not reduce {dimension}-dimensional vectors, "
+                        f"skipping it")
+        pca_dimensions = 0
+    reduced = pca_dimensions or dimension
+    quantizer_type = SCALAR_QUANTIZERS.get(compression)
+
+    if index_type == "Flat":
+        if quantizer_type is None:
+            index = faiss.IndexFlatL2(reduced)
+        else:
+            index = faiss.IndexScalarQuantizer(reduced, quantizer_type, faiss.METRIC_L2)
+    elif index_type == "HNSW":
+        if quantizer_type is None:
+            index = faiss.IndexHNSWFlat(reduced, hnsw_m)
+        else:
+            index = faiss.IndexHNSWSQ(reduced, quantizer_type, hnsw_m)
+    elif index_type in ("IVFFlat", "IVFPQ"):
+        # k-means needs roughly 39 training points per list to be meaningful.
+        nlist = max(1, min(nlist, count // 39))
+        quantizer = faiss.IndexFlatL2(reduced)
+        if index_type == "IVFFlat":
+            if quantizer_type is None:
+                index = faiss.IndexIVFFlat(quantizer, reduced, nlist)
+            else:
+                index = faiss.IndexIVFScalarQuantizer(quantizer, reduced, nlist, quantizer_type)
+        else:
+            if reduced % pq_m:
+                raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {reduced}")
+            if quantizer_type is not None:
+                logging.info("IVFPQ codes are already compressed, ignoring the vector compression setting")
+            nbits = max(1, min(8, int(math.log2(max(2, count)))))
+            index = faiss.IndexIVFPQ(quantizer, reduced, nlist, pq_m, nbits)
+    else:
+        raise ValueError(f"Unknown FAISS index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+    if pca_dimensions:
+        # The projection is fitted with the index and saved in the same file.
+        index = faiss.IndexPreTransform(faiss.PCAMatrix(dimension, pca_dimensions), index)
+
+    if not index.is_trained:
+        sample = vectors
+        if count > train_sample:
+            sample = vectors[np.random.default_rng(0).choice(count, train_sample, replace=False)]
+        logging.info(f"Training {index_type} index on {len(sample)} vectors...")
+        index.train(sample)
+    return index
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexPreTransform):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def exact_rerank(query: np.ndarray, vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    distances = np.square(vectors - query).sum(axis=1)
+    order = np.argsort(distances, kind="stable")[:k]
+    return order, distances[order]
+
+
+def set_search_parameters(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    index = base_index(index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = nprobe
+    if isinstance(index, faiss.IndexHNSW) and ef_search:
+        index.hnsw.efSearch = ef_search
+
+
+def search_parameters(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    # Parameters passed to a search replace the index's own nprobe and
+    # efSearch, so those are carried over with the selector.
+    index = base_index(index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
 
 
 class FAISSStore(VectorStore):
-    def __init__(self, embedding_model, index_path="faiss_index"):
+    def __init__(self, embedding_model, index_path="faiss_index", index_type="Flat", nlist=1024, pq_m=64,
+                 hnsw_m=32, nprobe=16, ef_search=64, train_sample=100000, mmap=False, search_mode="vector",
+                 compression="none", pca_dimensions=0, rerank=0):
         self.index_path = index_path
         self.index = None
+        self.metadata = None
+        self.lexical = None
         self.embedding_model = embedding_model
+        self.index_type = index_type
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.hnsw_m = hnsw_m
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.train_sample = train_sample
+        self.mmap = mmap
+        self.search_mode = search_mode
+        self.compression = compression
+        self.pca_dimensions = pca_dimensions
+        # Vector searches fetch rerank times k candidates and order them by
+        # their full-precision vectors, which are then kept in metadata.db.
+        self.rerank = rerank
+        self._selections = OrderedDict()
+        self._selections_lock = threading.Lock()
+        # Modification time of the index file last read or written.
+        self._loaded_mtime = None
+
+    # Vectors live in index.faiss, searchable metadata in metadata.db and the
+    # full article text in a separate table of it that is only read by
+    # get_texts(), so loading the index never touches the corpus text.
+    @property
+    def _index_file(self) -> str:
+        return os.path.join(self.index_path, "index.faiss")
+
+    def _open_metadata(self) -> MetadataStore:
+        if self.metadata is None:
+            os.makedirs(self.index_path, exist_ok=True)
+            self.metadata = MetadataStore(os.path.join(self.index_path, "metadata.db"))
+        return self.metadata
 
-    def build_index(self, documents: List[Document]) -> None:
+    def _open_lexical(self) -> LexicalIndex:
+        if self.lexical is None:
+            os.makedirs(self.index_path, exist_ok=True)
+            self.lexical = LexicalIndex(os.path.join(self.index_path, "lexical.db"))
+        return self.lexical
+
+    def _backfill_lexical(self) -> None:
+        # Indexes built before the lexical index existed get one from their metadata.
+        if self._open_lexical().count() or not self.metadata.count():
+            return
+        logging.info("Building lexical index from existing metadata...")
+        self._rebuild_lexical()
+
+    def _rebuild_lexical(self) -> None:
+        documents = self.metadata.documents()
+        texts = self.metadata.get_texts([doc.id for doc in documents])
+        for doc in documents:
+            doc.metadata["text"] = texts.get(doc.id, "")
+        self._open_lexical().add(documents, replace=True)
+
+    def build_index(self, documents: Iterable[Document]) -> None:
+        if self.mmap:
+            logging.error("FAISS index is memory-mapped read-only, cannot build.")
+            return
         try:
-            logging.info("Building FAISS index...")
+            # IVF indexes train on the whole corpus, so the stream is collected first.
+            documents = list(documents)
+            logging.info(f"Building FAISS {self.index_type} index...")
+
+            # Embedding and training happen before anything stored is touched,
+            # so a failed rebuild leaves the previous index, metadata and
+            # lexical index as they were.
+            vectors = self._embed(documents)
+            keys = list(range(1, len(documents) + 1))
+            index = self._create_index(vectors, keys)
+            metadata = self._open_metadata()
+            lexical = self._open_lexical()
 
-            self.index = FAISS.from_documents(documents=documents, embedding=self.embedding_model)
-            self.save_index()
+            def replace() -> None:
+                lexical.add(documents, replace=True)
+                try:
+                    metadata.add(documents, keys, vectors if self.rerank else None, replace=True)
+                except Exception:
+                    self._rebuild_lexical()
+                    raise
 
+            self._commit(index, replace)
             logging.info("FAISS index successfully built.")
         except Exception as e:
             logging.error(f"Error building FAISS index: {str(e)}")
+            raise
+
+    def _embed(self, documents: List[Document]) -> np.ndarray:
+        with METRICS.stage("embed", documents=len(documents)):
+            return np.array(self.embedding_model.embed_documents([doc.page_content for doc in documents]),
+                            dtype=np.float32)
+
+    def _create_index(self, vectors: np.ndarray, keys: List[int]) -> faiss.Index:
+        with METRICS.stage("index_write", documents=len(keys)):
+            index = create_faiss_index(self.index_type, vectors, nlist=self.nlist, pq_m=self.pq_m,
+                                       hnsw_m=self.hnsw_m, train_sample=self.train_sample,
+                                       compression=self.compression, pca_dimensions=self.pca_dimensions)
+            # IVF indexes store ids natively; the others need an id map so that
+            # vectors keep their metadata key when other vectors are removed.
+            if not isinstance(base_index(index), faiss.IndexIVF):
+                index = faiss.IndexIDMap2(index)
+            set_search_parameters(index, self.nprobe, self.ef_search)
+            index.add_with_ids(vectors, np.array(keys, dtype=np.int64))
+        return index
+
+    def _commit(self, index: Optional[faiss.Index], write_metadata) -> None:
+        # The new index is written aside and only replaces index.faiss once the
+        # metadata its keys refer to is committed, so vectors never point at
+        # the wrong articles and a server reloading it never reads half a file.
+        os.makedirs(self.index_path, exist_ok=True)
+        temporary = f"{self._index_file}.tmp"
+        try:
+            if index is not None:
+                with METRICS.stage("index_write", path=self._index_file):
+                    faiss.write_index(index, temporary)
+            write_metadata()
+        except Exception:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        if index is not None:
+            os.replace(temporary, self._index_file)
+            self._loaded_mtime = os.stat(self._index_file).st_mtime_ns
+        elif os.path.exists(self._index_file):
+            os.remove(self._index_file)
+        self.index = index
+        self._clear_selections()
+        logging.info(f"Index saved at {self.index_path}")
+
+    def _reload(self) -> None:
+        # Drops changes made in memory before a failure by reading back the
+        # last saved index.
+        self.index = None
+        self._clear_selections()
+        self.load_index()
+
+    def upsert(self, documents: List[Document]) -> None:
+        if not documents:
+            return
+        if self.mmap:
+            logging.error("FAISS index is memory-mapped read-only, cannot upsert.")
+            return
+        if self.index is None:
+            self.build_index(documents)
+            return
+        try:
+            # Embedded before anything changes, so a failed embedding call
+            # leaves the index, metadata and lexical index as they were.
+            vectors = self._embed(documents)
+            ids = [doc.id for doc in documents]
+            previous = self.metadata.keys_for(ids)
+            first = self.metadata.next_key()
+            keys = list(range(first, first + len(documents)))
+            lexical = self._open_lexical()
+
+            def write() -> None:
+                lexical.add(documents)
+                try:
+                    self.metadata.add(documents, keys, vectors if self.rerank else None)
+                except Exception:
+                    # Documents that were already indexed keep identical entries.
+                    lexical.delete([doc_id for doc_id in ids if doc_id not in previous])
+                    raise
+
+            try:
+                index = self._index_without(previous)
+                if index is None:
+                    index = self._create_index(vectors, keys)
+                else:
+                    with METRICS.stage("index_write", documents=len(keys)):
+                        index.add_with_ids(vectors, np.array(keys, dtype=np.int64))
+                self._commit(index, write)
+            except Exception:
+                self._reload()
+                raise
+            logging.info(f"Upserted {len(documents)} documents into FAISS index.")
+        except Exception as e:
+            logging.error(f"Error upserting into FAISS index: {str(e)}")
+            raise
+
+    def delete(self, ids: List[str]) -> None:
+        if self.index is None or not ids:
+            return
+        if self.mmap:
+            logging.error("FAISS index is memory-mapped read-only, cannot delete.")
+            return
+        try:
+            keys = self.metadata.keys_for(ids)
+            if not keys:
+                return
+            try:
+                self._commit(self._index_without(keys), lambda: self.metadata.delete(list(keys)))
+            except Exception:
+                self._reload()
+                raise
+            # Entries left behind by a failure here match no metadata and are
+            # dropped from lexical results.
+            self._open_lexical().delete(list(keys))
+            logging.info(f"Deleted {len(keys)} documents from FAISS index.")
+        except Exception as e:
+            logging.error(f"Error deleting from FAISS index: {str(e)}")
+            raise
+
+    def _index_without(self, keys: Dict[str, int]) -> Optional[faiss.Index]:
+        if not keys:
+            return self.index
+        if isinstance(base_index(self.index), faiss.IndexHNSW):
+            # HNSW graphs do not support removal; rebuild from the vectors of
+            # the remaining documents, without embedding them again.
+            keys_by_id = self.metadata.keys_for(self.metadata.ids())
+            remaining = [(doc_id, key) for doc_id, key in keys_by_id.items() if doc_id not in keys]
+            if not remaining:
+                return None
+            remaining_keys = [key for _, key in remaining]
+            return self._create_index(self._stored_vectors([doc_id for doc_id, _ in remaining], remaining_keys),
+                                      remaining_keys)
+        self.index.remove_ids(np.array(list(keys.values()), dtype=np.int64))
+        return self.index
+
+    def _stored_vectors(self, ids: List[str], keys: List[int]) -> np.ndarray:
+        full = self.metadata.get_vectors(ids) if self.rerank else {}
+        if len(full) == len(ids):
+            return np.stack([full[doc_id] for doc_id in ids])
+        # Decoded from the index: exact for flat storage, within the
+        # quantization error for fp16 and int8. PCA output stays in the fitted
+        # subspace, so the projection refitted on it is the same.
+        return self.index.reconstruct_batch(np.array(keys, dtype=np.int64))
+
+    def list_ids(self) -> List[str]:
+        if self.index is None:
+            return []
+        return self.metadata.ids()
+
+    def get_texts(self, ids: List[str]) -> Dict[str, str]:
+        if self.metadata is None:
+            return {}
+        return self.metadata.get_texts(ids)
 
     def index_exists(self) -> bool:
         return self.index is not None
 
     def save_index(self) -> None:
-        if self.index is not None:
+        if self.mmap:
+            logging.warning("Index is memory-mapped read-only, not saving.")
+        elif self.index is not None:
             try:
-                self.index.save_local(self.index_path)
-                logging.info(f"Index saved at {self.index_path}")
+                self._commit(self.index, lambda: None)
             except Exception as e:
                 logging.error(f"Error saving FAISS index: {str(e)}")
+                raise
         else:
             logging.warning("Index is None, cannot save.")
 
     def load_index(self) -> None:
-        if os.path.exists(self.index_path):
+        if os.path.exists(self._index_file):
             try:
-                self.index = FAISS.load_local(self.index_path, embeddings=self.embedding_model, allow_dangerous_deserialization=True)
-                logging.info(f"Index loaded from {self.index_path}")
+                flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if self.mmap else 0
+                modified = os.stat(self._index_file).st_mtime_ns
+                self.index = faiss.read_index(self._index_file, flags)
+                self._loaded_mtime = modified
+                self._clear_selections()
+                set_search_parameters(self.index, self.nprobe, self.ef_search)
+                self._open_metadata()
+                self._backfill_lexical()
+                logging.info(f"Index loaded from {self.index_path}{' (memory-mapped)' if self.mmap else ''}")
             except Exception as e:
                 logging.error(f"Error loading FAISS index: {str(e)}")
+        elif os.path.exists(os.path.join(self.index_path, "index.pkl")):
+            logging.warning("Found an index in the old pickled format, it will be rebuilt.")
         else:
             logging.warning("No index file found, need to build a new one.")
 
-    def search(self, query: str, k: int = 3) -> List[Dict]:
+    def refresh(self) -> bool:
+        # Picks up an index rewritten by another process, e.g. the ingest daemon.
+        try:
+            modified = os.stat(self._index_file).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if modified == self._loaded_mtime:
+            return False
+        self.load_index()
+        return True
+
+    def search(self, query: str, k: int = 3, mode: Optional[str] = None,
+               filters: Optional[SearchFilter] = None) -> List[Dict]:
+        mode = mode or self.search_mode
         if self.index is None:
             logging.warning("Index is not loaded. Please load or build the index first.")
             return []
 
         try:
-            results = self.index.similarity_search_with_score(query, k=k)
-            return [
-                     {
-                         "title": r[0].metadata["title"],
-                         "summary": r[0].metadata["summary"],
-                         "topics": r[0].metadata["topics"],
-                         "url": r[0].metadata["url"]
-                     }
-                     for r in results
-                 ]
+            with METRICS.stage("search", query=query, mode=mode, filtered=bool(filters)):
+                selection = self._select(filters)
+                if selection is not None and not selection[1]:
+                    return []
+                if mode == "lexical":
+                    return self._lexical_search(query, k, selection)
+                candidates = k * HYBRID_CANDIDATES if mode == "hybrid" else k
+                with METRICS.stage("embed", queries=1):
+                    embedding = np.array([self.embedding_model.embed_query(query)], dtype=np.float32)
+                results = self._search_vectors(embedding, candidates, selection)[0]
+                if mode == "hybrid":
+                    results = reciprocal_rank_fusion([results, self._lexical_search(query, candidates, selection)], k)
+                return results
         except Exception as e:
             logging.error(f"Error during search: {str(e)}")
             return []
+
+    def search_many(self, queries: List[str], k: int = 3, mode: Optional[str] = None,
+                    filters: Optional[SearchFilter] = None) -> List[List[Dict]]:
+        mode = mode or self.search_mode
+        if self.index is None:
+            logging.warning("Index is not loaded. Please load or build the index first.")
+            return [[] for _ in queries]
+        if mode == "lexical":
+            return [self.search(query, k, mode, filters) for query in queries]
+
+        try:
+            with METRICS.stage("search", queries=len(queries), mode=mode, filtered=bool(filters)):
+                selection = self._select(filters)
+                if selection is not None and not selection[1]:
+                    return [[] for _ in queries]
+                candidates = k * HYBRID_CANDIDATES if mode == "hybrid" else k
+                with METRICS.stage("embed", queries=len(queries)):
+                    embeddings = np.array(self.embedding_model.embed_documents(queries), dtype=np.float32)
+                results = self._search_vectors(embeddings, candidates, selection)
+                if mode == "hybrid":
+                    results = [reciprocal_rank_fusion([found, self._lexical_search(query, candidates, selection)], k)
+                               for query, found in zip(queries, results)]
+                return results
+        except Exception as e:
+            logging.error(f"Error during batch search: {str(e)}")
+            return [[] for _ in queries]
+
+    def _select(self, filters: Optional[SearchFilter]) -> Optional[Tuple[faiss.IDSelector, Set[str]]]:
+        # A filter is resolved once against the topic, domain and date indexes
+        # in metadata.db into an id selector, so the vector search itself only
+        # visits matching documents. Selectors are reused until the index changes.
+        if not filters:
+            return None
+        with self._selections_lock:
+            if filters in self._selections:
+                self._selections.move_to_end(filters)
+                return self._selections[filters]
+        matching = self.metadata.matching(filters)
+        keys = np.fromiter(matching.values(), dtype=np.int64, count=len(matching))
+        selection = faiss.IDSelectorBatch(keys), set(matching)
+        with self._selections_lock:
+            self._selections[filters] = selection
+            while len(self._selections) > FILTER_CACHE_SIZE:
+                self._selections.popitem(last=False)
+        return selection
+
+    def _clear_selections(self) -> None:
+        with self._selections_lock:
+            self._selections.clear()
+
+    def _lexical_search(self, query: str, k: int,
+                        selection: Optional[Tuple[faiss.IDSelector, Set[str]]] = None) -> List[Dict]:
+        ranked = self._open_lexical().search(query, k, selection[1] if selection else None)
+        keys = self.metadata.keys_for([doc_id for doc_id, _ in ranked])
+        found = self.metadata.get(keys.values())
+        return [{**found[keys[doc_id]], "score": score} for doc_id, score in ranked if keys.get(doc_id) in found]
+
+    def _search_vectors(self, embeddings: np.ndarray, k: int,
+                        selection: Optional[Tuple[faiss.IDSelector, Set[str]]] = None) -> List[List[Dict]]:
+        # Scores are negated squared L2 distances, so higher is better as for
+        # the lexical ranking and results from several indexes can be merged.
+        params = search_parameters(self.index, selection[0]) if selection else None
+        distances, keys = self.index.search(embeddings, k * self.rerank if self.rerank else k, params=params)
+        found = self.metadata.get(key for key in keys.ravel() if key != -1)
+        results = [[{**found[key], "score": -float(distance)} for distance, key in zip(row_distances, row)
+                    if key in found] for row_distances, row in zip(distances, keys)]
+        if self.rerank:
+            results = [self._rerank(embedding, row, k) for embedding, row in zip(embeddings, results)]
+        return results
+
+    def _rerank(self, embedding: np.ndarray, results: List[Dict], k: int) -> List[Dict]:
+        if not results:
+            return []
+        vectors = self.metadata.get_vectors([result["id"] for result in results])
+        if len(vectors) < len(results):
+            logging.warning("Full-precision vectors missing, rebuild the index with --rerank to re-rank results")
+            return results[:k]
+        order, distances = exact_rerank(embedding, np.stack([vectors[result["id"]] for result in results]), k)
+        return [{**results[i], "score": -float(distance)} for i, distance in zip(order, distances)]
@@ -0,0 +1,153 @@
+import heapq
+import math
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from utils.text_utils import tokenize
+
+# Title and topics say what an article is about, so their terms count double.
+FIELD_WEIGHTS = (("title", 2), ("topics", 2), ("summary", 1), ("text", 1))
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_CONSTANT = 60
+# Hybrid search fuses this many times k candidates from each ranking.
+HYBRID_CANDIDATES = 4
+
+
+def reciprocal_rank_fusion(rankings: List[List[dict]], k: int) -> List[dict]:
+    scores = defaultdict(float)
+    by_id = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking):
+            scores[result["id"]] += 1 / (RRF_CONSTANT + rank + 1)
+            by_id.setdefault(result["id"], result)
+    return [{**by_id[doc_id], "score": scores[doc_id]} for doc_id in sorted(scores, key=scores.get, reverse=True)[:k]]
+
+
+class LexicalIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents (doc INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, "
+            "length INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, doc INTEGER NOT NULL, tf INTEGER NOT NULL, "
+            "PRIMARY KEY (term, doc)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc)")
+        # Corpus size and total length are kept in one row so a query does not
+        # have to scan the documents table for BM25's average length.
+        self._conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO stats VALUES ('documents', 0), ('length', 0)")
+        self._conn.commit()
+
+    @staticmethod
+    def _terms(doc: Document) -> Counter:
+        terms = Counter()
+        for field, weight in FIELD_WEIGHTS:
+            value = doc.metadata.get(field, "")
+            if isinstance(value, list):
+                value = " ".join(value)
+            for token in tokenize(value):
+                terms[token] += weight
+        return terms
+
+    def add(self, documents: List[Document], replace: bool = False) -> None:
+        # One transaction, so a failure leaves the index as it was; replace
+        # swaps the whole corpus for the documents.
+        with self._lock, self._conn:
+            if replace:
+                self._clear()
+            else:
+                self._delete([doc.id for doc in documents])
+            for doc in documents:
+                terms = self._terms(doc)
+                length = sum(terms.values())
+                cursor = self._conn.execute("INSERT INTO documents (id, length) VALUES (?, ?)", (doc.id, length))
+                self._conn.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                                       [(term, cursor.lastrowid, tf) for term, tf in terms.items()])
+                self._update_stats(1, length)
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock, self._conn:
+            self._delete(ids)
+
+    def _delete(self, ids: List[str]) -> None:
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT doc, length FROM documents WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for doc, length in rows:
+                self._conn.execute("DELETE FROM postings WHERE doc = ?", (doc,))
+                self._conn.execute("DELETE FROM documents WHERE doc = ?", (doc,))
+                self._update_stats(-1, -length)
+
+    def _update_stats(self, documents: int, length: int) -> None:
+        self._conn.execute("UPDATE stats SET value = value + ? WHERE name = 'documents'", (documents,))
+        self._conn.execute("UPDATE stats SET value = value + ? WHERE name = 'length'", (length,))
+
+    def search(self, query: str, k: int = 5, allowed: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        terms = set(tokenize(query))
+        scores: Dict[int, float] = defaultdict(float)
+        with self._lock:
+            stats = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            count = stats["documents"]
+            if not terms or not count:
+                return []
+            average_length = stats["length"] / count
+            for term in terms:
+                postings = self._conn.execute(
+                    "SELECT p.doc, p.tf, d.length FROM postings p JOIN documents d ON d.doc = p.doc WHERE p.term = ?",
+                    (term,)
+                ).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc, tf, length in postings:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    scores[doc] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+            if allowed is not None:
+                # Only the documents matching a search filter are ranked.
+                ids = self._ids(list(scores))
+                scores = {doc: score for doc, score in scores.items() if ids[doc] in allowed}
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            if not best:
+                return []
+            ids = self._ids([doc for doc, _ in best])
+        return [(ids[doc], score) for doc, score in best]
+
+    def _ids(self, docs: List[int]) -> Dict[int, str]:
+        found = {}
+        for start in range(0, len(docs), 500):
+            chunk = docs[start:start + 500]
+            found.update(self._conn.execute(
+                f"SELECT doc, id FROM documents WHERE doc IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        return found
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT value FROM stats WHERE name = 'documents'").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._clear()
+
+    def _clear(self) -> None:
+        self._conn.execute("DELETE FROM postings")
+        self._conn.execute("DELETE FROM documents")
+        self._conn.execute("UPDATE stats SET value = 0")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
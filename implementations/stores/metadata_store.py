@@ -0,0 +1,222 @@
+import json
+import sqlite3
+import threading
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from interfaces.store import SearchFilter
+from utils.text_utils import date_number, topic_key, url_date, url_domain
+
+
+class MetadataStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # key is the id the vector is stored under in the vector index.
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                   key INTEGER PRIMARY KEY,
+                   id TEXT NOT NULL UNIQUE,
+                   title TEXT NOT NULL,
+                   url TEXT NOT NULL,
+                   summary TEXT NOT NULL,
+                   topics TEXT NOT NULL,
+                   page_content TEXT NOT NULL,
+                   domain TEXT NOT NULL DEFAULT '',
+                   published INTEGER NOT NULL DEFAULT 0
+               )"""
+        )
+        # Inverted index from each topic to the documents that have it; with
+        # the domain and published columns it answers search filters without
+        # scanning the documents.
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS topics (topic TEXT NOT NULL, key INTEGER NOT NULL, "
+            "PRIMARY KEY (topic, key)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS topics_key ON topics (key)")
+        self._migrate()
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_domain ON documents (domain)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_published ON documents (published)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS texts (id TEXT PRIMARY KEY, text TEXT NOT NULL) WITHOUT ROWID")
+        # Full-precision float32 vectors, only kept when searches re-rank
+        # candidates from a compressed index.
+        self._conn.execute("CREATE TABLE IF NOT EXISTS vectors (id TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    def _migrate(self) -> None:
+        # Indexes built before search filters existed get their filter columns
+        # and topic index from the stored URLs and topics.
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        if "domain" in columns:
+            return
+        self._conn.execute("ALTER TABLE documents ADD COLUMN domain TEXT NOT NULL DEFAULT ''")
+        self._conn.execute("ALTER TABLE documents ADD COLUMN published INTEGER NOT NULL DEFAULT 0")
+        rows = self._conn.execute("SELECT key, url, topics FROM documents").fetchall()
+        for key, url, topics in rows:
+            self._conn.execute("UPDATE documents SET domain = ?, published = ? WHERE key = ?",
+                               (url_domain(url), date_number(url_date(url)), key))
+            self._add_topics(key, json.loads(topics))
+        if rows:
+            logging.info(f"Indexed search filters for {len(rows)} documents in {self.path}")
+
+    def _add_topics(self, key: int, topics: List[str]) -> None:
+        self._conn.executemany("INSERT OR IGNORE INTO topics VALUES (?, ?)",
+                               [(topic_key(topic), key) for topic in topics if topic.strip()])
+
+    def add(self, documents: List[Document], keys: Optional[List[int]] = None,
+            vectors: Optional[np.ndarray] = None, replace: bool = False) -> List[int]:
+        # One transaction: earlier versions of the documents, or every document
+        # when replacing, are only swapped out once all new rows are written.
+        with self._lock, self._conn:
+            if replace:
+                self._clear()
+            else:
+                self._delete([doc.id for doc in documents])
+            added = []
+            for position, doc in enumerate(documents):
+                url = doc.metadata["url"]
+                cursor = self._conn.execute(
+                    "INSERT INTO documents (key, id, title, url, summary, topics, page_content, domain, published) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (keys[position] if keys is not None else None, doc.id, doc.metadata["title"], url,
+                     doc.metadata["summary"], json.dumps(doc.metadata["topics"]), doc.page_content,
+                     url_domain(url), date_number(url_date(url)))
+                )
+                self._add_topics(cursor.lastrowid, doc.metadata["topics"])
+                added.append(cursor.lastrowid)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO texts (id, text) VALUES (?, ?)",
+                [(doc.id, doc.metadata.get("text", "")) for doc in documents]
+            )
+            if vectors is not None:
+                self._put_vectors(dict(zip((doc.id for doc in documents), vectors)))
+        return added
+
+    def next_key(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(key), 0) + 1 FROM documents").fetchone()[0]
+
+    def put_texts(self, texts: Dict[str, str]) -> None:
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO texts (id, text) VALUES (?, ?)", list(texts.items()))
+            self._conn.commit()
+
+    def _put_vectors(self, vectors: Dict[str, np.ndarray]) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO vectors (id, vector) VALUES (?, ?)",
+            [(doc_id, np.asarray(vector, dtype=np.float32).tobytes()) for doc_id, vector in vectors.items()]
+        )
+
+    def get_vectors(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                for doc_id, vector in self._conn.execute(
+                        f"SELECT id, vector FROM vectors WHERE id IN ({','.join('?' * len(chunk))})", chunk):
+                    found[doc_id] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def get(self, keys: Iterable[int]) -> Dict[int, Dict]:
+        keys = [int(key) for key in keys]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, id, title, url, summary, topics FROM documents "
+                    f"WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, doc_id, title, url, summary, topics in rows:
+                    found[key] = {"id": doc_id, "title": title, "summary": summary,
+                                  "topics": json.loads(topics), "url": url}
+        return found
+
+    def get_texts(self, ids: List[str]) -> Dict[str, str]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                found.update(self._conn.execute(
+                    f"SELECT id, text FROM texts WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+        return found
+
+    def keys_for(self, ids: List[str]) -> Dict[str, int]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                found.update(self._conn.execute(
+                    f"SELECT id, key FROM documents WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+        return found
+
+    def documents(self) -> List[Document]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, title, url, summary, topics, page_content FROM documents ORDER BY key"
+            ).fetchall()
+        return [
+            Document(id=doc_id, page_content=page_content,
+                     metadata={"title": title, "url": url, "summary": summary, "topics": json.loads(topics)})
+            for doc_id, title, url, summary, topics, page_content in rows
+        ]
+
+    def matching(self, filters: SearchFilter) -> Dict[str, int]:
+        conditions, values = [], []
+        if filters.topics:
+            conditions.append(f"key IN (SELECT key FROM topics WHERE topic IN ({','.join('?' * len(filters.topics))}))")
+            values.extend(filters.topics)
+        if filters.domains:
+            conditions.append(f"domain IN ({','.join('?' * len(filters.domains))})")
+            values.extend(filters.domains)
+        if filters.published_after or filters.published_before:
+            # Undated documents are stored as 0 and never match a date range.
+            conditions.append("published BETWEEN ? AND ?")
+            values.extend([max(1, date_number(filters.published_after)),
+                           date_number(filters.published_before) or 99991231])
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            return dict(self._conn.execute(f"SELECT id, key FROM documents{where}", values).fetchall())
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM documents ORDER BY key")]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock, self._conn:
+            self._delete(ids)
+
+    def _delete(self, ids: List[str]) -> None:
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            self._conn.execute(f"DELETE FROM topics WHERE key IN (SELECT key FROM documents "
+                               f"WHERE id IN ({placeholders}))", chunk)
+            self._conn.execute(f"DELETE FROM documents WHERE id IN ({placeholders})", chunk)
+            self._conn.execute(f"DELETE FROM texts WHERE id IN ({placeholders})", chunk)
+            self._conn.execute(f"DELETE FROM vectors WHERE id IN ({placeholders})", chunk)
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._clear()
+
+    def _clear(self) -> None:
+        self._conn.execute("DELETE FROM documents")
+        self._conn.execute("DELETE FROM topics")
+        self._conn.execute("DELETE FROM texts")
+        self._conn.execute("DELETE FROM vectors")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,294 @@
+import heapq
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from interfaces.store import SearchFilter, VectorStore
+from implementations.registry import get_store_class
+from implementations.stores.lexical_index import HYBRID_CANDIDATES, reciprocal_rank_fusion
+from utils.metrics import METRICS
+from utils.text_utils import url_date, url_domain
+
+SHARD_KEYS = ("month", "domain")
+UNDATED_SHARD = "undated"
+
+
+def domain_shard_name(domain: str) -> str:
+    return re.sub(r"[^a-z0-9.-]", "_", domain) or "unknown"
+
+
+def shard_name(url: str, shard_by: str) -> str:
+    if shard_by == "month":
+        published = url_date(url)
+        return published.strftime("%Y-%m") if published else UNDATED_SHARD
+    if shard_by == "domain":
+        return domain_shard_name(url_domain(url))
+    raise ValueError(f"Unknown shard key {shard_by!r}, expected one of {SHARD_KEYS}")
+
+
+class SharedQueryEmbeddings(Embeddings):
+    # Every shard embeds the same query. The sharded store embeds it once
+    # before fanning out and the shards read it back from here.
+    def __init__(self, embeddings: Embeddings, size: int = 1024):
+        self.embeddings = embeddings
+        self.size = size
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, kind: str, texts: List[str], vectors: List[List[float]]) -> None:
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                self._vectors[(kind, text)] = vector
+                self._vectors.move_to_end((kind, text))
+            while len(self._vectors) > self.size:
+                self._vectors.popitem(last=False)
+
+    def _recall(self, kind: str, texts: List[str]) -> Optional[List[List[float]]]:
+        with self._lock:
+            if all((kind, text) in self._vectors for text in texts):
+                return [self._vectors[(kind, text)] for text in texts]
+        return None
+
+    def prime_query(self, text: str) -> None:
+        if self._recall("query", [text]) is None:
+            self._remember("query", [text], [self.embeddings.embed_query(text)])
+
+    def prime_documents(self, texts: List[str]) -> None:
+        if self._recall("documents", texts) is None:
+            self._remember("documents", texts, self.embeddings.embed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        found = self._recall("query", [text])
+        return found[0] if found is not None else self.embeddings.embed_query(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        found = self._recall("documents", texts)
+        return found if found is not None else self.embeddings.embed_documents(texts)
+
+
+class ShardedStore(VectorStore):
+    def __init__(self, backend: str, embedding_model, index_path: Optional[str] = None, shard_by: str = "month",
+                 shard_workers: int = 4, search_shards: Optional[List[str]] = None, recent_shards: int = 0,
+                 search_mode: str = "vector", **backend_options):
+        if shard_by not in SHARD_KEYS:
+            raise ValueError(f"Unknown shard key {shard_by!r}, expected one of {SHARD_KEYS}")
+        self.backend = backend
+        self.index_path = index_path or f"{backend.lower()}_shards"
+        self.shard_by = shard_by
+        self.search_shards = search_shards or []
+        self.recent_shards = recent_shards
+        self.search_mode = search_mode
+        self.backend_options = backend_options
+        self.embedding_model = SharedQueryEmbeddings(embedding_model) if embedding_model is not None else None
+        self._shards: Dict[str, VectorStore] = {}
+        self._lock = threading.Lock()
+        # Threads rather than processes: FAISS, SQLite and Chroma release the
+        # GIL while they search, and every worker shares the loaded shards
+        # instead of loading its own copy of each one.
+        self._pool = ThreadPoolExecutor(max_workers=max(1, shard_workers), thread_name_prefix="shard")
+        self._check_layout()
+
+    # Each shard is a complete FAISS or Chroma index in its own directory,
+    # so one can be rebuilt, dropped or archived without opening the others.
+    @property
+    def _layout_file(self) -> str:
+        return os.path.join(self.index_path, "shards.json")
+
+    def _check_layout(self) -> None:
+        if not os.path.exists(self._layout_file):
+            return
+        with open(self._layout_file, 'r', encoding='utf-8') as f:
+            layout = json.load(f)
+        if layout != {"backend": self.backend, "shard_by": self.shard_by}:
+            raise ValueError(f"{self.index_path} holds {layout['backend']} shards by {layout['shard_by']}, "
+                             f"not {self.backend} shards by {self.shard_by}; rebuild it or use another path")
+
+    def _write_layout(self) -> None:
+        os.makedirs(self.index_path, exist_ok=True)
+        with open(self._layout_file, 'w', encoding='utf-8') as f:
+            json.dump({"backend": self.backend, "shard_by": self.shard_by}, f)
+
+    def shard_names(self) -> List[str]:
+        if not os.path.isdir(self.index_path):
+            return []
+        return sorted(name for name in os.listdir(self.index_path)
+                      if os.path.isdir(os.path.join(self.index_path, name)))
+
+    def shard_for(self, url: str) -> str:
+        return shard_name(url, self.shard_by)
+
+    def _shard(self, name: str) -> VectorStore:
+        with self._lock:
+            shard = self._shards.get(name)
+            if shard is None:
+                shard = get_store_class(self.backend)(embedding_model=self.embedding_model,
+                                                      index_path=os.path.join(self.index_path, name),
+                                                      search_mode=self.search_mode, **self.backend_options)
+                if hasattr(shard, "load_index") and os.path.isdir(os.path.join(self.index_path, name)):
+                    shard.load_index()
+                self._shards[name] = shard
+        return shard
+
+    def _searched_shards(self, filters: Optional[SearchFilter] = None) -> List[str]:
+        names = self.shard_names()
+        if self.search_shards:
+            names = [name for name in names if name in self.search_shards]
+        if self.recent_shards and self.shard_by == "month":
+            # Month names sort chronologically; undated articles are never "recent".
+            names = [name for name in names if name != UNDATED_SHARD][-self.recent_shards:]
+        # Shards that cannot hold a match for the filter are not searched at all.
+        if filters and self.shard_by == "month" and (filters.published_after or filters.published_before):
+            first = filters.published_after.strftime("%Y-%m") if filters.published_after else "0000-00"
+            last = filters.published_before.strftime("%Y-%m") if filters.published_before else "9999-99"
+            names = [name for name in names if name != UNDATED_SHARD and first <= name <= last]
+        if filters and self.shard_by == "domain" and filters.domains:
+            wanted = {domain_shard_name(domain) for domain in filters.domains}
+            names = [name for name in names if name in wanted]
+        return names
+
+    def _partition(self, documents: Iterable[Document]) -> Dict[str, List[Document]]:
+        shards = defaultdict(list)
+        for doc in documents:
+            shards[self.shard_for(doc.metadata["url"])].append(doc)
+        return shards
+
+    def _map(self, function, names: List[str]) -> list:
+        return list(self._pool.map(function, names))
+
+    def build_index(self, documents: Iterable[Document]) -> None:
+        shards = self._partition(documents)
+        for name in self.shard_names():
+            if name not in shards:
+                self.drop_shard(name)
+        self._write_layout()
+        logging.info(f"Building {len(shards)} {self.backend} shards by {self.shard_by}...")
+        self._map(lambda name: self._build_shard(name, shards[name]), list(shards))
+
+    def rebuild_shard(self, name: str, documents: Iterable[Document]) -> None:
+        documents = list(documents)
+        if not documents:
+            # An ingestion that yields nothing, e.g. because every fetch
+            # failed, leaves the existing shard alone.
+            logging.error(f"No documents to rebuild shard {name} from, keeping the existing shard.")
+            return
+        misplaced = [doc.metadata["url"] for doc in documents if self.shard_for(doc.metadata["url"]) != name]
+        if misplaced:
+            raise ValueError(f"{len(misplaced)} documents belong to other shards than {name}, e.g. {misplaced[0]}")
+        self._write_layout()
+        self._build_shard(name, documents)
+
+    def _build_shard(self, name: str, documents: List[Document]) -> None:
+        with METRICS.stage("shard_build", shard=name, documents=len(documents)):
+            self._shard(name).build_index(documents)
+        logging.info(f"Built shard {name} with {len(documents)} documents.")
+
+    def drop_shard(self, name: str, archive_dir: Optional[str] = None) -> None:
+        path = os.path.join(self.index_path, name)
+        if not os.path.isdir(path):
+            logging.warning(f"Shard {name} not found in {self.index_path}")
+            return
+        if archive_dir and os.path.exists(os.path.join(archive_dir, name)):
+            raise ValueError(f"{archive_dir} already holds a shard named {name}")
+        with self._lock:
+            self._shards.pop(name, None)
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+            shutil.move(path, os.path.join(archive_dir, name))
+            logging.info(f"Archived shard {name} to {archive_dir}")
+        else:
+            shutil.rmtree(path)
+            logging.info(f"Dropped shard {name}")
+
+    def index_exists(self) -> bool:
+        return any(self._shard(name).index_exists() for name in self.shard_names())
+
+    def refresh(self) -> bool:
+        # New shards are opened on their first search anyway.
+        with self._lock:
+            shards = list(self._shards.values())
+        return any([shard.refresh() for shard in shards])
+
+    def upsert(self, documents: List[Document]) -> None:
+        if not documents:
+            return
+        self._write_layout()
+        shards = self._partition(documents)
+        self._map(lambda name: self._shard(name).upsert(shards[name]), list(shards))
+
+    def delete(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        wanted = set(ids)
+
+        def delete_from(name: str) -> None:
+            shard = self._shard(name)
+            present = [doc_id for doc_id in shard.list_ids() if doc_id in wanted]
+            if present:
+                shard.delete(present)
+
+        self._map(delete_from, self.shard_names())
+
+    def list_ids(self) -> List[str]:
+        return [doc_id for ids in self._map(lambda name: self._shard(name).list_ids(), self.shard_names())
+                for doc_id in ids]
+
+    def get_texts(self, ids: List[str]) -> Dict[str, str]:
+        found = {}
+        for texts in self._map(lambda name: self._shard(name).get_texts(ids), self.shard_names()):
+            found.update(texts)
+        return found
+
+    def search(self, query: str, k: int = 3, mode: Optional[str] = None,
+               filters: Optional[SearchFilter] = None) -> List[Dict]:
+        return self.search_many([query], k, mode, filters)[0]
+
+    def search_many(self, queries: List[str], k: int = 3, mode: Optional[str] = None,
+                    filters: Optional[SearchFilter] = None) -> List[List[Dict]]:
+        mode = mode or self.search_mode
+        names = self._searched_shards(filters)
+        if not names:
+            if filters:
+                logging.info("No shard can hold results matching the search filters.")
+            else:
+                logging.warning("No shards to search. Please build the index first.")
+            return [[] for _ in queries]
+
+        with METRICS.stage("sharded_search", queries=len(queries), mode=mode, shards=len(names)):
+            if mode == "hybrid":
+                # Fused per shard, ranks would not be comparable across
+                # shards, so both rankings are merged globally first.
+                candidates = k * HYBRID_CANDIDATES
+                vector = self._fan_out(queries, candidates, "vector", names, filters)
+                lexical = self._fan_out(queries, candidates, "lexical", names, filters)
+                return [reciprocal_rank_fusion([found, keywords], k) for found, keywords in zip(vector, lexical)]
+            return self._fan_out(queries, k, mode, names, filters)
+
+    def _fan_out(self, queries: List[str], k: int, mode: str, names: List[str],
+                 filters: Optional[SearchFilter] = None) -> List[List[Dict]]:
+        if mode == "vector":
+            with METRICS.stage("embed", queries=len(queries)):
+                if len(queries) == 1:
+                    self.embedding_model.prime_query(queries[0])
+                else:
+                    self.embedding_model.prime_documents(queries)
+
+        def search_shard(name: str) -> List[List[Dict]]:
+            shard = self._shard(name)
+            if len(queries) == 1:
+                return [shard.search(queries[0], k, mode, filters)]
+            return shard.search_many(queries, k, mode, filters)
+
+        per_shard = self._map(search_shard, names)
+        # Each shard returns its own top k; the global top k is among them.
+        return [heapq.nlargest(k, (result for results in shard_results for result in results),
+                               key=lambda result: result.get("score", float("-inf")))
+                for shard_results in zip(*per_shard)]
@@ -0,0 +1,122 @@
+import argparse
+import logging
+import signal
+import threading
+
+from implementations.fetch_cache import FetchCache
+from implementations.registry import STORES
+from main import (add_embedding_arguments, add_pipeline_arguments, add_rag_arguments, add_store_arguments,
+                  create_analyzer, create_pipeline, create_store, setup_logging, store_options)
+from utils.metrics import METRICS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the index up to date from RSS/Atom feeds and sitemaps.")
+    parser.add_argument('--logging', action='store_true', help="Enable logging")
+    parser.add_argument('--index', choices=list(STORES), required=True,
+                        help="Index type to use (FAISS or Chroma)")
+    add_store_arguments(parser)
+    parser.add_argument('--feeds', type=str, default="feeds.txt",
+                        help="File listing one feed or sitemap URL per line, optionally followed by its polling "
+                             "interval in minutes")
+    parser.add_argument('--frontier', type=str, default="frontier.db",
+                        help="On-disk record of polling schedules and every article URL discovered so far")
+    parser.add_argument('--poll_interval', type=float, default=15,
+                        help="Minutes between polls of sources that do not set their own interval")
+    parser.add_argument('--poll_jitter', type=float, default=0.2,
+                        help="Random fraction added to or taken from each polling interval")
+    parser.add_argument('--poll_workers', type=int, default=4,
+                        help="Feeds polled at the same time")
+    parser.add_argument('--batch_size', type=int, default=32,
+                        help="New articles ingested and indexed together in one micro-batch")
+    parser.add_argument('--batch_wait', type=float, default=30,
+                        help="Seconds a new article waits for its micro-batch to fill before it is ingested anyway")
+    parser.add_argument('--max_attempts', type=int, default=3,
+                        help="Attempts at a failing article before it is given up on")
+    parser.add_argument('--retry_delay', type=float, default=300,
+                        help="Seconds before a failed article is retried, doubled after each attempt")
+    parser.add_argument('--max_age_days', type=float, default=0,
+                        help="Skip feed entries published more than this many days ago (0 to keep all)")
+    parser.add_argument('--once', action='store_true',
+                        help="Poll every feed once, ingest what is new and exit, e.g. from cron")
+    add_pipeline_arguments(parser)
+    # Feeds put many articles of the same site in a batch.
+    parser.set_defaults(per_host=2)
+    parser.add_argument('--fetch_cache', type=str, default="fetch_cache.db",
+                        help="On-disk cache of fetched pages; pass an empty string to disable")
+    parser.add_argument('--fetch_cache_size', type=float, default=512,
+                        help="Max size of the fetch cache in MB before least recently used pages are evicted")
+    add_embedding_arguments(parser)
+    add_rag_arguments(parser)
+    parser.add_argument('--analysis_cache', type=str, default="analysis_cache.db",
+                        help="On-disk cache of LLM article analyses; pass an empty string to disable")
+    parser.add_argument('--metrics_file', type=str, default="",
+                        help="Write a JSON summary of per-stage timings, token usage and cache hits here on exit")
+    parser.add_argument('--trace_file', type=str, default="",
+                        help="Append one JSON span per poll, micro-batch, fetch, parse, analyze and index write "
+                             "to this file")
+    args = parser.parse_args()
+    args.cache_only = False
+    setup_logging(args.logging)
+
+    if args.trace_file:
+        METRICS.enable_tracing(args.trace_file)
+    try:
+        run(args)
+    finally:
+        METRICS.disable_tracing()
+        if args.metrics_file:
+            METRICS.write_summary(args.metrics_file)
+
+
+def run(args):
+    from implementations.frontier import Frontier
+    from implementations.ingestion_daemon import IngestionDaemon, load_sources
+
+    sources = load_sources(args.feeds, args.poll_interval)
+    if not sources:
+        logging.error(f"No feeds found in {args.feeds}. Exiting.")
+        return
+
+    analyzer = create_analyzer(args, args.analysis_cache)
+    try:
+        store = create_store(args.index, analyzer.get_embedding_model(), **store_options(args))
+    except Exception as e:
+        logging.error(f"Failed to initialize {args.index} store: {str(e)}. Exiting.")
+        return
+
+    fetch_cache = FetchCache(args.fetch_cache, args.fetch_cache_size) if args.fetch_cache else None
+    duplicates = None
+    if args.dedup_index:
+        from implementations.duplicate_index import DuplicateIndex
+
+        # Not pruned: the frontier, not urls.txt, lists the pages seen so far.
+        duplicates = DuplicateIndex(args.dedup_index, threshold=args.dedup_threshold)
+    pipeline = create_pipeline(args, analyzer, fetch_cache, duplicates)
+    frontier = Frontier(args.frontier)
+    daemon = IngestionDaemon(store, pipeline, frontier, sources,
+                             poll_workers=args.poll_workers,
+                             hosts=pipeline.extractor.hosts,
+                             batch_size=args.batch_size,
+                             batch_wait=args.batch_wait,
+                             jitter=args.poll_jitter,
+                             max_attempts=args.max_attempts,
+                             retry_delay=args.retry_delay,
+                             max_age_days=args.max_age_days)
+    try:
+        if args.once:
+            daemon.run_once()
+        else:
+            stop = threading.Event()
+            # The micro-batch in progress is finished and recorded before exiting.
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: stop.set())
+            daemon.run(stop)
+    finally:
+        daemon.close()
+        logging.info("Frontier: %s", frontier.stats())
+        frontier.close()
+
+
+if __name__ == "__main__":
+    main()
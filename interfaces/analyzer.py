@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
+from typing import Iterator, Optional
 
-from interfaces.store import VectorStore
+from interfaces.store import SearchFilter, VectorStore
 
 
 class Analyzer(ABC):
@@ -13,7 +14,13 @@ class Analyzer(ABC):
         pass
 
     @abstractmethod
-    def perform_rag_search(self, store: VectorStore, query: str, k: int = 3) -> str:
+    def perform_rag_search(self, store: VectorStore, query: str, k: int = 3,
+                           filters: Optional[SearchFilter] = None) -> str:
+        pass
+
+    @abstractmethod
+    def stream_rag_search(self, store: VectorStore, query: str, k: int = 3,
+                          filters: Optional[SearchFilter] = None) -> Iterator[str]:
         pass
 
     @abstractmethod
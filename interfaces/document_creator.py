@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from langchain.schema import Document
+from langchain_core.documents import Document
 from typing import List
 
 
@@ -1,6 +1,22 @@
 from abc import ABC, abstractmethod
+from typing import NamedTuple
+
+
+class FetchResult(NamedTuple):
+    html: str
+    not_modified: bool = False
+
 
 class Extractor(ABC):
     @abstractmethod
     def extract(self, url: str) -> tuple[str, str]:
-        pass
\ No newline at end of file
+        pass
+
+    @abstractmethod
+    def fetch(self, url: str) -> FetchResult:
+        pass
+
+    @staticmethod
+    @abstractmethod
+    def parse(html: str) -> tuple[str, str]:
+        pass
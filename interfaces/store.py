@@ -1,11 +1,36 @@
+import datetime
 from abc import ABC, abstractmethod
-from typing import List, Optional, Dict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from utils.text_utils import domain_key, topic_key
+
+# vector: embedding similarity, lexical: local BM25 only (no embedding call),
+# hybrid: both rankings fused.
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+
+
+class SearchFilter(NamedTuple):
+    # A result must have one of the topics, come from one of the domains and
+    # have a URL dated within the range; empty fields match everything.
+    topics: Tuple[str, ...] = ()
+    domains: Tuple[str, ...] = ()
+    published_after: Optional[datetime.date] = None
+    published_before: Optional[datetime.date] = None
+
+    @classmethod
+    def create(cls, topics: Iterable[str] = (), domains: Iterable[str] = (),
+               published_after: Optional[datetime.date] = None,
+               published_before: Optional[datetime.date] = None) -> Optional["SearchFilter"]:
+        filters = cls(tuple(sorted({topic_key(topic) for topic in topics or () if topic.strip()})),
+                      tuple(sorted({domain_key(domain) for domain in domains or () if domain.strip()})),
+                      published_after, published_before)
+        return filters if any(filters) else None
 
 
 class VectorStore(ABC):
 
     @abstractmethod
-    def build_index(self, documents: List[dict]) -> None:
+    def build_index(self, documents: Iterable[dict]) -> None:
         pass
 
     @abstractmethod
@@ -13,5 +38,32 @@ class VectorStore(ABC):
         pass
 
     @abstractmethod
-    def search(self, query: str, k: int = 5) -> List[Dict]:
-        pass
\ No newline at end of file
+    def search(self, query: str, k: int = 5, mode: Optional[str] = None,
+               filters: Optional[SearchFilter] = None) -> List[Dict]:
+        pass
+
+    @abstractmethod
+    def search_many(self, queries: List[str], k: int = 5, mode: Optional[str] = None,
+                    filters: Optional[SearchFilter] = None) -> List[List[Dict]]:
+        pass
+
+    @abstractmethod
+    def upsert(self, documents: List[dict]) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, ids: List[str]) -> None:
+        pass
+
+    @abstractmethod
+    def list_ids(self) -> List[str]:
+        pass
+
+    @abstractmethod
+    def get_texts(self, ids: List[str]) -> Dict[str, str]:
+        pass
+
+    def refresh(self) -> bool:
+        # Reloads an index changed on disk by another process; returns
+        # whether anything was reloaded.
+        return False
@@ -1,13 +1,16 @@
 import logging
 import argparse
-import json
 import datetime
-from implementations.basic_document_creator import BasicDocumentCreator
-from implementations.stores.chroma_store import ChromaStore
-from implementations.stores.faiss_store import FAISSStore
-from implementations.genai_analyser import GenAIAnalyzer
-from implementations.html_content_extractor import HTMLContentExtractor
-from utils.text_utils import load_urls_from_file
+import json
+import itertools
+import os
+import sys
+from implementations.fetch_cache import FetchCache
+from implementations.registry import EMBEDDINGS, STORES, get_analyzer_class, get_store_class
+from implementations.search_history import SearchHistory
+from interfaces.store import SEARCH_MODES, SearchFilter
+from utils.metrics import METRICS
+from utils.text_utils import format_search_results, load_urls_from_file, url_key, url_key_from_id
 
 def setup_logging(enable_logging=True):
     if enable_logging:
@@ -23,45 +26,351 @@ def setup_logging(enable_logging=True):
         logging.disable(logging.CRITICAL)
 
 def load_history(history_file, max_history=5):
+    return SearchHistory(history_file).tail(max_history)  # Лимит на последние N
+
+def save_history(history_file, query):
+    SearchHistory(history_file).append(query)
+
+def store_options(args):
+    options = {}
+    if args.shard_by != "none":
+        options = {"shard_by": args.shard_by, "shard_workers": args.shard_workers,
+                   "search_shards": args.search_shards, "recent_shards": args.recent_shards}
+    if args.index == "FAISS":
+        return {
+            **options,
+            "index_type": args.faiss_index_type,
+            "nlist": args.nlist,
+            "pq_m": args.pq_m,
+            "hnsw_m": args.hnsw_m,
+            "nprobe": args.nprobe,
+            "ef_search": args.ef_search,
+            "mmap": args.mmap,
+            "search_mode": args.retrieval,
+            "compression": args.vector_compression,
+            "pca_dimensions": args.pca_dimensions,
+            "rerank": args.rerank,
+        }
+    if args.vector_compression != "none" or args.pca_dimensions or args.rerank:
+        logging.warning("Chroma keeps float32 vectors; use --embedding_dimensions to shrink them. "
+                        "--vector_compression, --pca_dimensions and --rerank only apply to FAISS.")
+    return {**options, "batch_size": args.build_batch_size, "search_mode": args.retrieval}
+
+def create_store(backend, embedding_model, **options):
+    if options.get("shard_by", "none") != "none":
+        from implementations.stores.sharded_store import ShardedStore
+
+        return ShardedStore(backend, embedding_model, **options)
+    options.pop("shard_by", None)
+    store = get_store_class(backend)(embedding_model=embedding_model, **options)
+    if hasattr(store, "load_index"):
+        store.load_index()
+    return store
+
+def create_pipeline(args, analyzer, fetch_cache, duplicates=None):
+    # Ingestion pulls in requests, BeautifulSoup and the OpenAI SDK, so it is
+    # only imported when the index actually has to be built or updated.
+    from implementations.analysis_scheduler import AnalysisScheduler
+    from implementations.basic_document_creator import BasicDocumentCreator
+    from implementations.html_content_extractor import HTMLContentExtractor
+    from implementations.ingestion_pipeline import IngestionPipeline
+
+    extractor = HTMLContentExtractor(pool_size=args.fetch_workers, cache=fetch_cache, cache_only=args.cache_only,
+                                     per_host=args.per_host)
+    scheduler = AnalysisScheduler(analyzer,
+                                  max_concurrency=args.analyze_workers,
+                                  requests_per_minute=args.requests_per_minute,
+                                  tokens_per_minute=args.tokens_per_minute,
+                                  batch_size=args.analysis_batch_size)
+    # Enough analysis workers to fill every batch of every in-flight request.
+    return IngestionPipeline(extractor, scheduler, BasicDocumentCreator(),
+                             fetch_workers=args.fetch_workers,
+                             parse_workers=args.parse_workers,
+                             analyze_workers=args.analyze_workers * max(1, args.analysis_batch_size),
+                             fetch_cache=fetch_cache,
+                             duplicates=duplicates)
+
+def create_duplicate_index(args, urls):
+    if not args.dedup_index:
+        return None
+    from implementations.duplicate_index import DuplicateIndex
+
+    duplicates = DuplicateIndex(args.dedup_index, threshold=args.dedup_threshold)
+    duplicates.prune(urls)
+    return duplicates
+
+def augment_query(analyzer, query, history_file, max_history):
+    logging.info("Contextual mode: Loading search history...")
+    history = load_history(history_file, max_history)
+    if not history:
+        logging.info("No history found. Falling back to RAG search.")
+        return query
+    history_queries = [entry['query'] for entry in history]
+    augmented_query = analyzer.augment_query_with_history(history_queries, query)
+    logging.info(f"Augmented query: {augmented_query}")
+    return augmented_query
+
+def read_queries(queries_file, batch_size):
+    batch = []
+    with open(queries_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            query = line.strip()
+            if not query:
+                continue
+            batch.append(query)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def run_batch_queries(store, queries_file, output, k, batch_size, filters=None):
+    out = sys.stdout if output == "-" else open(output, 'w', encoding='utf-8')
+    count = 0
     try:
-        with open(history_file, 'r') as f:
-            history = json.load(f)
-        return history[-max_history:]  # Лимит на последние N
-    except FileNotFoundError:
-        return []
-    except json.JSONDecodeError:
-        logging.warning("Invalid history file format. Starting fresh.")
+        for queries in read_queries(queries_file, batch_size):
+            for query, results in zip(queries, store.search_many(queries, k, filters=filters)):
+                out.write(json.dumps({"query": query, "results": results}, ensure_ascii=False) + "\n")
+            out.flush()
+            count += len(queries)
+            logging.info("Answered %d queries from %s", count, queries_file)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+def load_feed_urls(frontier_path):
+    # Articles ingest.py added to the same index are not listed in urls.txt.
+    if not frontier_path or not os.path.exists(frontier_path):
         return []
+    from implementations.frontier import Frontier
 
-def save_history(history_file, query):
-    history = load_history(history_file)
-    history.append({
-        'timestamp': datetime.datetime.now().isoformat(),
-        'query': query
-    })
-    with open(history_file, 'w') as f:
-        json.dump(history, f, indent=4)
+    frontier = Frontier(frontier_path)
+    try:
+        return frontier.urls()
+    finally:
+        frontier.close()
+
+def merge_urls(urls, feed_urls):
+    keys = {url_key(url) for url in urls}
+    return urls + [url for url in feed_urls if url_key(url) not in keys]
+
+def update_index(store, pipeline, urls, feed_urls=()):
+    existing_ids = store.list_ids()
+    pipeline.known_ids = set(existing_ids)
+    documents = pipeline.run(urls)
+
+    # Pages found to be copies of another one are dropped even if an earlier
+    # run indexed them. Articles ingested from feeds are kept up to date by
+    # ingest.py and are not stale just because urls.txt does not list them.
+    current_keys = ({url_key(url) for url in urls} | {url_key(url) for url in feed_urls}) \
+        - {url_key(url) for url in pipeline.aliases}
+    changed_keys = {url_key(doc.metadata["url"]) for doc in documents}
+    new_ids = {doc.id for doc in documents}
+    stale_ids = [
+        doc_id for doc_id in existing_ids
+        if url_key_from_id(doc_id) not in current_keys
+        or (url_key_from_id(doc_id) in changed_keys and doc_id not in new_ids)
+    ]
+
+    logging.info("Incremental update: %d new or changed documents, %d stale documents",
+                 len(documents), len(stale_ids))
+    store.upsert(documents)
+    store.delete(stale_ids)
+
+def add_store_arguments(parser):
+    parser.add_argument('--faiss_index_type', choices=['Flat', 'HNSW', 'IVFFlat', 'IVFPQ'], default='Flat',
+                        help="FAISS index structure used when building the index")
+    parser.add_argument('--nlist', type=int, default=1024,
+                        help="Number of inverted lists for IVF indexes")
+    parser.add_argument('--pq_m', type=int, default=64,
+                        help="Number of product quantizer sub-vectors for IVFPQ (must divide the embedding size)")
+    parser.add_argument('--hnsw_m', type=int, default=32,
+                        help="Number of neighbours per node for HNSW")
+    parser.add_argument('--nprobe', type=int, default=16,
+                        help="Inverted lists visited per IVF search")
+    parser.add_argument('--ef_search', type=int, default=64,
+                        help="Candidate list size for HNSW search")
+    parser.add_argument('--mmap', action='store_true',
+                        help="Memory-map the FAISS index read-only so several processes share it")
+    parser.add_argument('--retrieval', choices=list(SEARCH_MODES), default='vector',
+                        help="How results are retrieved: 'vector' by embedding similarity, 'lexical' by local BM25 "
+                             "keyword ranking without any API call, 'hybrid' by fusing both rankings")
+    parser.add_argument('--build_batch_size', type=int, default=256,
+                        help="Documents embedded and written per Chroma batch while building")
+    parser.add_argument('--vector_compression', choices=['none', 'fp16', 'int8'], default='none',
+                        help="Scalar quantization of FAISS vectors: 'fp16' halves them, 'int8' quarters them")
+    parser.add_argument('--pca_dimensions', type=int, default=0,
+                        help="Reduce FAISS vectors to this many dimensions with a PCA fitted at build time "
+                             "(0 to keep them all)")
+    parser.add_argument('--rerank', type=int, default=0,
+                        help="Keep full-precision vectors on disk and re-rank this many times k FAISS candidates "
+                             "exactly (0 to disable)")
+    parser.add_argument('--shard_by', choices=['none', 'month', 'domain'], default='none',
+                        help="Split the index into one shard per publication month or per site, "
+                             "searched in parallel and merged")
+    parser.add_argument('--shard_workers', type=int, default=4,
+                        help="Shards built or searched at the same time")
+    parser.add_argument('--search_shards', nargs='*', default=[],
+                        help="Only search these shards (e.g. 2024-05 or example.com)")
+    parser.add_argument('--recent_shards', type=int, default=0,
+                        help="Only search this many most recent month shards (0 for all)")
+
+def add_filter_arguments(parser):
+    parser.add_argument('--topics', nargs='*', default=[],
+                        help="Only return articles with at least one of these topics")
+    parser.add_argument('--domains', nargs='*', default=[],
+                        help="Only return articles from these sites, e.g. theguardian.com")
+    parser.add_argument('--published_after', type=datetime.date.fromisoformat, default=None,
+                        help="Only return articles whose URL is dated on or after this day (YYYY-MM-DD)")
+    parser.add_argument('--published_before', type=datetime.date.fromisoformat, default=None,
+                        help="Only return articles whose URL is dated on or before this day (YYYY-MM-DD)")
+
+def search_filters(args):
+    return SearchFilter.create(args.topics, args.domains, args.published_after, args.published_before)
+
+def add_embedding_arguments(parser):
+    parser.add_argument('--embeddings', choices=['openai'] + list(EMBEDDINGS), default='openai',
+                        help="Embedding provider: 'openai' through the GenAI API, 'hashed' for local hashed "
+                             "term-frequency vectors, 'local' for a sentence-transformers model on disk")
+    parser.add_argument('--embedding_dimensions', type=int, default=0,
+                        help="Vector size requested from the embedding provider; OpenAI and local models truncate "
+                             "their embeddings to it (0 for the provider default, 384 for hashed embeddings)")
+    parser.add_argument('--embedding_model_path', type=str, default="",
+                        help="Directory or name of the sentence-transformers model for 'local' embeddings")
+    parser.add_argument('--embedding_workers', type=int, default=1,
+                        help="Processes computing local embeddings during large builds")
+    parser.add_argument('--embedding_cache', type=str, default="embedding_cache.db",
+                        help="On-disk cache of embedding vectors; pass an empty string to disable")
+
+def add_rag_arguments(parser):
+    parser.add_argument('--context_tokens', type=int, default=1500,
+                        help="Token budget for the retrieved news packed into a RAG prompt")
+
+def embedding_options(args):
+    if args.embeddings == "hashed":
+        return {"dimensions": args.embedding_dimensions or 384, "workers": args.embedding_workers}
+    if args.embeddings == "local":
+        return {"model_path": args.embedding_model_path, "workers": args.embedding_workers,
+                "dimensions": args.embedding_dimensions or None}
+    return {"dimensions": args.embedding_dimensions or None}
+
+def create_analyzer(args, analysis_cache):
+    return get_analyzer_class()(embedding_cache=args.embedding_cache, analysis_cache=analysis_cache,
+                                embeddings=args.embeddings, embedding_options=embedding_options(args),
+                                context_tokens=args.context_tokens)
+
+def add_pipeline_arguments(parser):
+    parser.add_argument('--fetch_workers', type=int, default=8,
+                        help="Number of concurrent page downloads during index build")
+    parser.add_argument('--per_host', type=int, default=0,
+                        help="Max concurrent page downloads from any one site (0 for no limit)")
+    parser.add_argument('--parse_workers', type=int, default=2,
+                        help="Number of processes parsing HTML during index build")
+    parser.add_argument('--analyze_workers', type=int, default=4,
+                        help="Number of concurrent LLM analysis requests during index build")
+    parser.add_argument('--requests_per_minute', type=float, default=0,
+                        help="Max LLM analysis requests per minute (0 for no limit)")
+    parser.add_argument('--tokens_per_minute', type=float, default=0,
+                        help="Max LLM analysis tokens per minute (0 for no limit)")
+    parser.add_argument('--analysis_batch_size', type=int, default=1,
+                        help="Max number of short articles analyzed in a single completion")
+    parser.add_argument('--dedup_index', type=str, default="duplicates.db",
+                        help="On-disk MinHash index used to skip copies of already seen articles; "
+                             "pass an empty string to disable")
+    parser.add_argument('--dedup_threshold', type=float, default=0.8,
+                        help="Estimated text similarity above which an article counts as a copy")
 
 def main():
     parser = argparse.ArgumentParser(description="Choose options for the search and indexing process.")
     parser.add_argument('--logging', action='store_true', help="Enable logging")
-    parser.add_argument('--index', choices=['FAISS', 'Chroma'], required=True,
+    parser.add_argument('--index', choices=list(STORES), required=True,
                         help="Index type to use (FAISS or Chroma)")
     parser.add_argument('--rebuild', action='store_true',
                         help="Force rebuild of the index")
+    add_store_arguments(parser)
+    parser.add_argument('--incremental', action='store_true',
+                        help="Update the existing index with new or changed URLs and drop URLs no longer listed")
     parser.add_argument('--search', choices=['basic', 'rag', 'contextual'], default='basic',
                         help="Search type: 'basic' for direct search, 'rag' for RAG-based search, 'contextual' for history-based augmentation")
     parser.add_argument('--query', type=str, default="",
                         help="Search query for basic or RAG search")
-    parser.add_argument('--history_file', type=str, default="search_history.json",
-                        help="File to store search history (for contextual mode)")
+    parser.add_argument('--k', type=int, default=3,
+                        help="Number of results to retrieve per query")
+    add_filter_arguments(parser)
+    parser.add_argument('--queries_file', type=str, default="",
+                        help="File with one query per line to run as a batch of basic searches")
+    parser.add_argument('--queries_batch_size', type=int, default=256,
+                        help="Number of queries embedded and searched together in batch mode")
+    parser.add_argument('--output', type=str, default="-",
+                        help="JSONL file for batch query results ('-' for stdout)")
+    parser.add_argument('--history_file', type=str, default="search_history.jsonl",
+                        help="Append-only JSON lines file storing search history (for contextual mode)")
     parser.add_argument('--max_history', type=int, default=5,
                         help="Max number of history entries to use (for contextual mode)")
+    add_pipeline_arguments(parser)
+    parser.add_argument('--fetch_cache', type=str, default="fetch_cache.db",
+                        help="On-disk cache of fetched pages; pass an empty string to disable")
+    parser.add_argument('--fetch_cache_size', type=float, default=512,
+                        help="Max size of the fetch cache in MB before least recently used pages are evicted")
+    add_embedding_arguments(parser)
+    add_rag_arguments(parser)
+    parser.add_argument('--analysis_cache', type=str, default="analysis_cache.db",
+                        help="On-disk cache of LLM article analyses; pass an empty string to disable")
+    parser.add_argument('--clear_analysis_cache', action='store_true',
+                        help="Discard all cached analyses before building the index")
+    parser.add_argument('--cache_only', action='store_true',
+                        help="Build from the fetch cache only, without network requests")
+    parser.add_argument('--metrics_file', type=str, default="",
+                        help="Write a JSON summary of per-stage timings, token usage and cache hits here at the end of the run")
+    parser.add_argument('--trace_file', type=str, default="",
+                        help="Append one JSON span per fetch, parse, analyze, embed, index write and search to this file")
+    parser.add_argument('--drop_shards', nargs='*', default=[],
+                        help="Remove these shards from a sharded index, e.g. months that are no longer needed")
+    parser.add_argument('--archive_dir', type=str, default="",
+                        help="Move dropped shards here instead of deleting them")
+    parser.add_argument('--rebuild_shard', type=str, default="",
+                        help="Re-fetch and rebuild only this shard of a sharded index")
+    parser.add_argument('--frontier', type=str, default="frontier.db",
+                        help="Frontier of ingest.py; articles it ingested into the same index are kept by "
+                             "incremental updates and re-ingested by rebuilds")
 
     args = parser.parse_args()
     setup_logging(args.logging)
 
-    if not args.query:
+    if args.trace_file:
+        METRICS.enable_tracing(args.trace_file)
+    try:
+        run(args)
+    finally:
+        METRICS.disable_tracing()
+        if args.metrics_file:
+            METRICS.write_summary(args.metrics_file)
+
+def drop_shards(args):
+    if args.shard_by == "none":
+        logging.error("--drop_shards requires --shard_by")
+        return
+    store = create_store(args.index, None, **store_options(args))
+    for name in args.drop_shards:
+        store.drop_shard(name, args.archive_dir or None)
+
+def rebuild_shard(store, pipeline, urls, name):
+    shard_urls = [url for url in urls if store.shard_for(url) == name]
+    if not shard_urls:
+        logging.error(f"No URLs in urls.txt belong to shard {name}")
+        return
+    logging.info(f"Rebuilding shard {name} from {len(shard_urls)} URLs...")
+    store.rebuild_shard(name, pipeline.stream(shard_urls))
+
+def run(args):
+    if args.drop_shards:
+        try:
+            drop_shards(args)
+        except Exception as e:
+            logging.error(f"Failed to drop shards: {str(e)}. Exiting.")
+            return
+
+    if not args.query and not args.queries_file and not args.rebuild_shard:
         logging.info("No query provided. Exiting.")
         return
 
@@ -69,9 +378,20 @@ def main():
     if not urls:
         logging.error("No URLs found in urls.txt. Exiting.")
         return
+    # Rebuilds re-ingest the articles ingest.py added from feeds as well, and
+    # their signatures stay in the duplicate index.
+    feed_urls = load_feed_urls(args.frontier)
+    indexed_urls = merge_urls(urls, feed_urls)
+    if feed_urls:
+        logging.info(f"{len(feed_urls)} articles were ingested from feeds by ingest.py ({args.frontier})")
 
-    extractor = HTMLContentExtractor()
-    analyzer = GenAIAnalyzer()
+    fetch_cache = FetchCache(args.fetch_cache, args.fetch_cache_size) if args.fetch_cache else None
+    if args.cache_only and fetch_cache is None:
+        logging.error("--cache_only requires a fetch cache. Exiting.")
+        return
+    analyzer = create_analyzer(args, args.analysis_cache)
+    if args.clear_analysis_cache and analyzer.analysis_cache is not None:
+        analyzer.analysis_cache.clear()
 
     try:
         embedding_model = analyzer.get_embedding_model()
@@ -81,42 +401,43 @@ def main():
         logging.error(f"Failed to initialize embedding model: {str(e)}. Exiting.")
         return
 
-    document_creator = BasicDocumentCreator()
-
     try:
-        if args.index == "FAISS":
-            store = FAISSStore(embedding_model=embedding_model)
-            store.load_index()
-        elif args.index == "Chroma":
-            store = ChromaStore(embedding_model=embedding_model)
+        store = create_store(args.index, embedding_model, **store_options(args))
     except Exception as e:
         logging.error(f"Failed to initialize {args.index} store: {str(e)}. Exiting.")
         return
 
-    if not store.index_exists() or args.rebuild:
+    if args.rebuild_shard:
+        if not hasattr(store, "rebuild_shard"):
+            logging.error("--rebuild_shard requires --shard_by. Exiting.")
+            return
+        try:
+            duplicates = create_duplicate_index(args, indexed_urls)
+            rebuild_shard(store, create_pipeline(args, analyzer, fetch_cache, duplicates), indexed_urls,
+                          args.rebuild_shard)
+        except Exception as e:
+            logging.error(f"Failed to rebuild shard {args.rebuild_shard}: {str(e)}. Exiting.")
+            return
+    elif store.index_exists() and args.incremental and not args.rebuild:
+        logging.info("Incremental update requested, updating existing index...")
+        try:
+            duplicates = create_duplicate_index(args, indexed_urls)
+            update_index(store, create_pipeline(args, analyzer, fetch_cache, duplicates), urls, feed_urls)
+        except Exception as e:
+            logging.error(f"Failed to update index: {str(e)}. Exiting.")
+            return
+    elif not store.index_exists() or args.rebuild:
         logging.info("Index not found or rebuild requested, creating documents...")
-        documents = []
-        for url in urls:
-            try:
-                title, text = extractor.extract(url)
-                if not text or not title:
-                    logging.warning(f"Failed to extract content from {url}: title={title}, text_length={len(text) if text else 0}")
-                    continue
-                summary, topics = analyzer.analyze(title, text)
-                if not summary or not topics:
-                    logging.warning(f"Analysis failed for {url}: summary={summary}, topics={topics}")
-                    continue
-                document = document_creator.create_document(title, summary, topics, text, url)
-                documents.append(document)
-                logging.info(f"Document created for {url}: title={title}")
-            except Exception as e:
-                logging.error(f"Error processing {url}: {str(e)}")
-                continue
+        documents = create_pipeline(args, analyzer, fetch_cache,
+                                    create_duplicate_index(args, indexed_urls)).stream(indexed_urls)
 
-        if documents:
-            logging.info("Building index with %d documents...", len(documents))
+        # Documents are streamed into the store as they are produced; wait for the
+        # first one so an ingestion that yields nothing leaves the old index alone.
+        first = next(documents, None)
+        if first is not None:
+            logging.info("Building index from document stream...")
             try:
-                store.build_index(documents)
+                store.build_index(itertools.chain([first], documents))
             except Exception as e:
                 logging.error(f"Failed to build index: {str(e)}. Exiting.")
                 return
@@ -126,50 +447,32 @@ def main():
     else:
         logging.info("Index exists, using existing index.")
 
-    query = args.query
+    if not args.query and not args.queries_file:
+        return
+
+    if analyzer.analysis_cache is not None:
+        stats = analyzer.analysis_cache.stats()
+        if stats["hits"] or stats["misses"]:
+            logging.info("Analysis cache: %d hits, %d misses", stats["hits"], stats["misses"])
 
+    if args.queries_file:
+        try:
+            run_batch_queries(store, args.queries_file, args.output, args.k, args.queries_batch_size,
+                              search_filters(args))
+        except OSError as e:
+            logging.error(f"Batch query failed: {str(e)}")
+        return
+
+    query = args.query
     if args.search == 'contextual':
-        logging.info("Contextual mode: Loading search history...")
-        history = load_history(args.history_file, args.max_history)
-        if history:
-            history_queries = [entry['query'] for entry in history]
-            augmented_query = analyzer.augment_query_with_history(history_queries, query)
-            logging.info(f"Augmented query: {augmented_query}")
-            query = augmented_query
-        else:
-            logging.info("No history found. Falling back to RAG search.")
+        query = augment_query(analyzer, query, args.history_file, args.max_history)
 
     if args.search == "basic":
         logging.info("Performing basic search for query: %s", query)
         try:
-            results = store.search(query)
+            results = store.search(query, args.k, filters=search_filters(args))
             if results:
-                best_result = results[0]
-                topics = best_result['topics']
-                if isinstance(topics, list):
-                    topics = ", ".join(topics)
-                best_result_str = (
-                    f"Best Result:\n"
-                    f"Title: {best_result['title'].encode('utf-8', errors='replace').decode('utf-8')}\n"
-                    f"URL: {best_result.get('url', 'N/A').encode('utf-8', errors='replace').decode('utf-8')}\n"
-                    f"Summary: {best_result['summary'].encode('utf-8', errors='replace').decode('utf-8')}\n"
-                    f"Topics: {topics.encode('utf-8', errors='replace').decode('utf-8')}"
-                )
-
-                other_results_str = ""
-                if len(results) > 1:
-                    other_results = [
-                        f"Result {i + 1}:\n"
-                        f"Title: {result['title'].encode('utf-8', errors='replace').decode('utf-8')}\n"
-                        f"URL: {result.get('url', 'N/A').encode('utf-8', errors='replace').decode('utf-8')}\n"
-                        f"Summary: {result['summary'].encode('utf-8', errors='replace').decode('utf-8')}\n"
-                        f"Topics: {', '.join(result['topics']) if isinstance(result['topics'], list) else result['topics']}"
-                        for i, result in enumerate(results[1:])
-                    ]
-                    other_results_str = "\n\n" + "\n\n".join(other_results)
-
-                formatted_results = best_result_str + other_results_str
-                logging.info("Basic search results:\n%s", formatted_results)
+                logging.info("Basic search results:\n%s", format_search_results(results))
             else:
                 logging.info("No results found for basic search.")
         except Exception as e:
@@ -177,8 +480,15 @@ def main():
     else:
         logging.info("Performing RAG search for query: %s", query)
         try:
-            result = analyzer.perform_rag_search(store, query)
-            logging.info("RAG search result: %s", result)
+            # The answer is printed as it is generated rather than after the
+            # whole completion arrives.
+            chunks = []
+            for chunk in analyzer.stream_rag_search(store, query, args.k, search_filters(args)):
+                sys.stdout.write(chunk)
+                sys.stdout.flush()
+                chunks.append(chunk)
+            sys.stdout.write("\n")
+            logging.info("RAG search result: %s", "".join(chunks).strip())
         except Exception as e:
             logging.error(f"RAG search failed: {str(e)}")
 
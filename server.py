@@ -0,0 +1,236 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, Optional, Tuple
+
+from implementations.registry import STORES
+from interfaces.store import SearchFilter
+from main import (add_embedding_arguments, add_rag_arguments, add_store_arguments, augment_query, create_analyzer,
+                  create_store, save_history, setup_logging, store_options)
+from utils.metrics import METRICS
+
+SEARCH_TYPES = ('basic', 'rag', 'contextual')
+
+
+class QueryService:
+    def __init__(self, analyzer, store, history_file="search_history.jsonl", max_history=5, refresh_interval=5.0):
+        self.analyzer = analyzer
+        self.store = store
+        self.history_file = history_file
+        self.max_history = max_history
+        self.refresh_interval = refresh_interval
+        self._refreshed = time.monotonic()
+        self._refresh_lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        # Articles indexed by ingest.py become searchable without a restart;
+        # the index file is checked at most once per refresh_interval.
+        if self.refresh_interval <= 0 or time.monotonic() - self._refreshed < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._refreshed = time.monotonic()
+            if self.store.refresh():
+                METRICS.inc("index_reloads_total")
+                logging.info("Reloaded the index after it changed on disk")
+        except Exception as e:
+            logging.error(f"Failed to reload the index: {str(e)}")
+        finally:
+            self._refresh_lock.release()
+
+    def _prepare(self, search_type: str, query: str) -> Tuple[dict, str]:
+        METRICS.inc("queries_total", search=search_type)
+        self._refresh()
+        response = {"search": search_type, "query": query}
+        if search_type == 'contextual':
+            query = augment_query(self.analyzer, query, self.history_file, self.max_history)
+            response["augmented_query"] = query
+        return response, query
+
+    def search(self, search_type: str, query: str, k: int = 3, filters: Optional[SearchFilter] = None) -> dict:
+        response, query = self._prepare(search_type, query)
+
+        if search_type == 'basic':
+            logging.info("Performing basic search for query: %s", query)
+            response["results"] = self.store.search(query, k, filters=filters)
+        else:
+            logging.info("Performing RAG search for query: %s", query)
+            response["answer"] = self.analyzer.perform_rag_search(self.store, query, k, filters)
+            save_history(self.history_file, response["query"])
+        return response
+
+    def stream_search(self, search_type: str, query: str, k: int = 3,
+                      filters: Optional[SearchFilter] = None) -> Iterator[dict]:
+        # One message with the query details, one per piece of the answer as
+        # the model produces it, and a final one once the answer is complete.
+        response, query = self._prepare(search_type, query)
+        yield response
+        logging.info("Streaming RAG search for query: %s", query)
+        for chunk in self.analyzer.stream_rag_search(self.store, query, k, filters):
+            yield {"delta": chunk}
+        save_history(self.history_file, response["query"])
+        yield {"done": True}
+
+
+def request_filters(request: dict) -> Optional[SearchFilter]:
+    def names(field: str) -> list:
+        value = request.get(field) or []
+        return [value] if isinstance(value, str) else [str(name) for name in value]
+
+    def day(field: str) -> Optional[datetime.date]:
+        value = request.get(field)
+        return datetime.date.fromisoformat(value) if value else None
+
+    return SearchFilter.create(names('topics'), names('domains'), day('published_after'), day('published_before'))
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    service: QueryService = None
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {"status": "ok"})
+        elif self.path == '/metrics':
+            self._send(200, METRICS.prometheus().encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8')
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/search':
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            search_type = request.get('search', 'basic')
+            query = request.get('query', '')
+            k = int(request.get('k', 3))
+            filters = request_filters(request)
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {"error": f"Invalid request: {str(e)}"})
+            return
+        if search_type not in SEARCH_TYPES or not query:
+            self._send_json(400, {"error": f"Expected a query and search type in {SEARCH_TYPES}"})
+            return
+
+        if request.get('stream') and search_type != 'basic':
+            self._stream_json(search_type, query, k, filters)
+            return
+
+        try:
+            self._send_json(200, self.service.search(search_type, query, k, filters))
+        except Exception as e:
+            logging.error(f"{search_type} search failed: {str(e)}")
+            self._send_json(500, {"error": str(e)})
+
+    def _stream_json(self, search_type: str, query: str, k: int, filters: Optional[SearchFilter] = None):
+        # Newline-delimited JSON without a Content-Length; the response ends
+        # when the connection closes.
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        try:
+            for message in self.service.stream_search(search_type, query, k, filters):
+                self._write_line(message)
+        except (BrokenPipeError, ConnectionResetError):
+            logging.info("Client disconnected during a streamed answer.")
+        except Exception as e:
+            logging.error(f"{search_type} search failed: {str(e)}")
+            self._write_line({"error": str(e)})
+
+    def _write_line(self, message: dict):
+        self.wfile.write(json.dumps(message, ensure_ascii=False).encode('utf-8') + b"\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8')
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        logging.info("%s - %s", self.address_string(), format % args)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve searches over a warm index.")
+    parser.add_argument('--logging', action='store_true', help="Enable logging")
+    parser.add_argument('--index', choices=list(STORES), required=True,
+                        help="Index type to use (FAISS or Chroma)")
+    add_store_arguments(parser)
+    parser.add_argument('--host', type=str, default="127.0.0.1", help="Address to listen on")
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on")
+    parser.add_argument('--socket', type=str, default="",
+                        help="Listen on this Unix socket instead of TCP")
+    parser.add_argument('--history_file', type=str, default="search_history.jsonl",
+                        help="Append-only JSON lines file storing search history (for contextual mode)")
+    parser.add_argument('--max_history', type=int, default=5,
+                        help="Max number of history entries to use (for contextual mode)")
+    add_embedding_arguments(parser)
+    add_rag_arguments(parser)
+    parser.add_argument('--analysis_cache', type=str, default="analysis_cache.db",
+                        help="On-disk cache of LLM results, here of augmented contextual queries; "
+                             "pass an empty string to disable")
+    parser.add_argument('--trace_file', type=str, default="",
+                        help="Append one JSON span per query stage to this file")
+    parser.add_argument('--refresh_interval', type=float, default=5,
+                        help="Seconds between checks for a FAISS index updated by ingest.py (0 to never reload)")
+    args = parser.parse_args()
+    setup_logging(args.logging)
+    if args.trace_file:
+        METRICS.enable_tracing(args.trace_file)
+
+    analyzer = create_analyzer(args, args.analysis_cache)
+    store = create_store(args.index, analyzer.get_embedding_model(), **store_options(args))
+    if not store.index_exists():
+        logging.error("Index not found. Build it with main.py first. Exiting.")
+        return
+    QueryRequestHandler.service = QueryService(analyzer, store, args.history_file, args.max_history,
+                                                args.refresh_interval)
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = ThreadingUnixHTTPServer(args.socket, QueryRequestHandler)
+        logging.info(f"Serving {args.index} searches on unix socket {args.socket}")
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), QueryRequestHandler)
+        logging.info(f"Serving {args.index} searches on http://{args.host}:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down.")
+    finally:
+        server.server_close()
+        METRICS.disable_tracing()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
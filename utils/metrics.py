@@ -0,0 +1,148 @@
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Upper bounds in seconds, from a fast search to a slow LLM completion.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_string(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Metrics:
+    def __init__(self, prefix: str = "newsparser"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters: Dict[tuple, float] = defaultdict(float)
+        self._timers: Dict[tuple, dict] = {}
+        self._trace_file = None
+        self._trace_lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        with self._lock:
+            self._counters[self._key(name, labels)] += value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                timer = self._timers[key] = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(BUCKETS)}
+            timer["count"] += 1
+            timer["sum"] += seconds
+            timer["max"] = max(timer["max"], seconds)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    timer["buckets"][i] += 1
+
+    @contextmanager
+    def stage(self, stage: str, **attributes):
+        # Times the block, counts it as a stage error if it raises, and writes a
+        # span carrying the attributes (url, query, ...) when tracing is on.
+        started = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            self.inc("stage_errors_total", stage=stage)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self.observe("stage_seconds", duration, stage=stage)
+            if self._trace_file is not None:
+                self._write_span(stage, started, duration, attributes, error)
+
+    def enable_tracing(self, path: str) -> None:
+        self.disable_tracing()
+        self._trace_file = open(path, 'a', encoding='utf-8')
+        logging.info(f"Writing trace spans to {path}")
+
+    def disable_tracing(self) -> None:
+        with self._trace_lock:
+            if self._trace_file is not None:
+                self._trace_file.close()
+                self._trace_file = None
+
+    def _write_span(self, stage: str, started: float, duration: float, attributes: dict,
+                    error: Optional[Exception]) -> None:
+        span = {"stage": stage, "start": round(started, 6), "duration_ms": round(duration * 1000, 3),
+                "thread": threading.current_thread().name, **attributes}
+        if error is not None:
+            span["error"] = str(error)
+        line = json.dumps(span, ensure_ascii=False) + "\n"
+        with self._trace_lock:
+            if self._trace_file is not None:
+                self._trace_file.write(line)
+                self._trace_file.flush()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._timers.clear()
+
+    def summary(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            timers = {key: dict(timer) for key, timer in self._timers.items()}
+        stages = {}
+        for (name, labels), timer in sorted(timers.items()):
+            if name != "stage_seconds":
+                continue
+            stage = dict(labels)["stage"]
+            stages[stage] = {
+                "count": timer["count"],
+                "total_seconds": round(timer["sum"], 3),
+                "mean_ms": round(timer["sum"] * 1000 / timer["count"], 3),
+                "max_ms": round(timer["max"] * 1000, 3),
+                "errors": int(counters.get(("stage_errors_total", labels), 0)),
+            }
+        return {
+            "stages": stages,
+            "counters": {f"{name}{_label_string(labels)}": int(value) if value == int(value) else value
+                         for (name, labels), value in sorted(counters.items()) if name != "stage_errors_total"},
+        }
+
+    def write_summary(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+        logging.info(f"Metrics summary written to {path}")
+
+    def prometheus(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            timers = sorted((key, dict(timer)) for key, timer in self._timers.items())
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{self.prefix}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_label_string(labels)} {int(value) if value == int(value) else value}")
+        for (name, labels), timer in timers:
+            metric = f"{self.prefix}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            for bound, count in zip(BUCKETS, timer["buckets"]):
+                lines.append(f"{metric}_bucket{_label_string(labels + (('le', f'{bound:g}'),))} {count}")
+            lines.append(f"{metric}_bucket{_label_string(labels + (('le', '+Inf'),))} {timer['count']}")
+            lines.append(f"{metric}_sum{_label_string(labels)} {timer['sum']:.6f}")
+            lines.append(f"{metric}_count{_label_string(labels)} {timer['count']}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
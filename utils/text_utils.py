@@ -1,6 +1,23 @@
+import datetime
+import hashlib
 import logging
 import re
-from typing import List
+from typing import List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+WORD = re.compile(r"\w+")
+MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+# News URLs carry their publication date as /2025/10/22/, /2025/oct/22/,
+# /2025-10-22- or /20251022-; the day is optional.
+URL_DATE = re.compile(
+    r"(?<![0-9])((?:19|20)\d{2})[/-]?(0[1-9]|1[0-2]|" + "|".join(MONTHS) + r")(?:[/-]?(0[1-9]|[12]\d|3[01]))?(?![0-9])",
+    re.IGNORECASE
+)
+STOPWORDS = frozenset((
+    "a an and are as at be been but by for from had has have he her his i if in into is it its more not of on "
+    "or our she so than that the their them there they this to was we were what when which who will with would "
+    "you said says after also about over up out new"
+).split())
 
 def extract_json(text: str) -> str:
     try:
@@ -13,15 +30,125 @@ def extract_json(text: str) -> str:
         logging.error("Error extracting JSON from the response text: %s", e)
         return "{}"
 
+def extract_json_array(text: str) -> str:
+    try:
+        match = re.search(r"\[.*\]", text, re.DOTALL)
+        if match:
+            return match.group(0)
+        logging.warning("No JSON array found in the response text.")
+        return "[]"
+    except Exception as e:
+        logging.error("Error extracting JSON array from the response text: %s", e)
+        return "[]"
+
+def _safe(value) -> str:
+    if isinstance(value, list):
+        value = ", ".join(value)
+    return str(value).encode('utf-8', errors='replace').decode('utf-8')
+
+def format_search_results(results: List[dict]) -> str:
+    formatted = []
+    for i, result in enumerate(results):
+        header = "Best Result:" if i == 0 else f"Result {i}:"
+        formatted.append(
+            f"{header}\n"
+            f"Title: {_safe(result['title'])}\n"
+            f"URL: {_safe(result.get('url', 'N/A'))}\n"
+            f"Summary: {_safe(result['summary'])}\n"
+            f"Topics: {_safe(result['topics'])}"
+        )
+    return "\n\n".join(formatted)
+
+def clean_url(line: str) -> str:
+    # Lists pasted from JSON or Python leave quotes, brackets and commas
+    # around the URLs.
+    return line.strip().strip("\"'[],").strip()
+
 def load_urls_from_file(file_path: str) -> List:
     try:
+        urls = []
         with open(file_path, 'r', encoding='utf-8') as file:
-            urls = [line.strip() for line in file.readlines()]
-            logging.info(f"Successfully loaded {len(urls)} URLs from {file_path}")
-            return urls
+            for number, line in enumerate(file, 1):
+                url = clean_url(line)
+                if not url or url.startswith("#"):
+                    continue
+                if not url.lower().startswith(("http://", "https://")):
+                    logging.warning(f"Skipping line {number} of {file_path}, not a URL: {line.strip()}")
+                    continue
+                urls.append(url)
+        logging.info(f"Successfully loaded {len(urls)} URLs from {file_path}")
+        return urls
     except FileNotFoundError:
         logging.error(f"File not found: {file_path}")
         return []
     except Exception as e:
         logging.error(f"Error reading file {file_path}: {e}")
-        return []
\ No newline at end of file
+        return []
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if parts.port and (parts.scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not key.lower().startswith("utm_"))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), host, path, urlencode(query), ""))
+
+
+def url_key(url: str) -> str:
+    return hashlib.sha1(normalize_url(url).encode("utf-8")).hexdigest()[:16]
+
+
+def content_hash(title: str, text: str) -> str:
+    return hashlib.sha1(f"{title}\n{text}".encode("utf-8")).hexdigest()[:16]
+
+
+def document_id(url: str, title: str, text: str) -> str:
+    return f"{url_key(url)}-{content_hash(title, text)}"
+
+
+def url_key_from_id(doc_id: str) -> str:
+    return doc_id.split("-", 1)[0]
+
+
+def url_date(url: str) -> Optional[datetime.date]:
+    for match in URL_DATE.finditer(urlsplit(url.strip()).path):
+        year, month, day = match.groups()
+        month = int(month) if month.isdigit() else MONTHS.index(month.lower()) + 1
+        try:
+            return datetime.date(int(year), month, int(day or 1))
+        except ValueError:
+            continue
+    return None
+
+
+def url_domain(url: str) -> str:
+    host = (urlsplit(url.strip()).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def domain_key(domain: str) -> str:
+    # Accepts a bare domain as well as a URL.
+    domain = domain.strip().lower()
+    if "//" in domain:
+        return url_domain(domain)
+    domain = domain.split("/", 1)[0]
+    return domain[4:] if domain.startswith("www.") else domain
+
+
+def topic_key(topic: str) -> str:
+    return " ".join(topic.lower().split())
+
+
+def date_number(date: Optional[datetime.date]) -> int:
+    # Dates are indexed as yyyymmdd integers, 0 when unknown, so that date
+    # ranges are plain integer comparisons in SQLite and Chroma alike.
+    return date.year * 10000 + date.month * 100 + date.day if date else 0
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in WORD.findall(text.lower()) if token not in STOPWORDS and len(token) > 1]
+
+def estimate_tokens(text: str) -> int:
+    # About four characters per token for English text with OpenAI tokenizers.
+    return len(text) // 4 + 1